@@ -46,7 +46,7 @@ class AdvancedCache:
             return True
         
         item = self.cache[key]
-        if time.time() > item['expires_at']:
+        if time.monotonic() > item['expires_at']:
             del self.cache[key]
             del self.access_times[key]
             return True
@@ -69,7 +69,7 @@ class AdvancedCache:
             return None
         
         self.hits += 1
-        self.access_times[key] = time.time()
+        self.access_times[key] = time.monotonic()
         return self.cache[key]['value']
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
@@ -79,12 +79,14 @@ class AdvancedCache:
             self._evict_lru()
         
         ttl = ttl or self.default_ttl
+        # Expiração e LRU em relógio monotônico (não muda com ajuste de hora)
+        now = time.monotonic()
         self.cache[key] = {
             'value': value,
-            'expires_at': time.time() + ttl,
+            'expires_at': now + ttl,
             'created_at': time.time()
         }
-        self.access_times[key] = time.time()
+        self.access_times[key] = now
     
     def invalidate(self, pattern: str = None):
         """Invalida cache por padrão"""
@@ -20,13 +20,31 @@ from alert_system import AlertSystem
 from alert_monitoring_service import AlertMonitoringService, check_alerts_once
 from gestor_whatsapp_notifier import GestorWhatsAppNotifier
 import os
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from dotenv import load_dotenv
 from routes.ai_webhook import register_ai_routes
+from socketio_tuning import LowLatencyRequestHandler, OrjsonJSON, MsgpackRedisManager
 
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
+# =======================
+# LOGGING
+# =======================
+# Quem loga apenas enfileira o registro; a escrita no stdout acontece
+# na thread do QueueListener, fora do caminho das requisições
+log_queue = queue.SimpleQueue()
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), handlers=[QueueHandler(log_queue)])
+log_listener = QueueListener(log_queue, log_stream_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 # =======================
 # CONFIGURAÇÃO PRINCIPAL
 # =======================
@@ -42,7 +60,29 @@ app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_CONTENT_LENGTH", 16 * 1024
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
 CORS(app, supports_credentials=True, origins=cors_origins)
 
-socketio = SocketIO(app, cors_allowed_origins=cors_origins, async_mode="threading")
+# Com SOCKETIO_MESSAGE_QUEUE (ex: redis://localhost:6379/0) o Flask-SocketIO usa o
+# RedisManager: cada emit para uma sala vira um único PUBLISH no canal, e cada
+# worker entrega apenas aos seus próprios sockets inscritos naquela sala
+# (MsgpackRedisManager: o tráfego entre workers usa msgpack em vez de pickle)
+socketio_queue = os.getenv("SOCKETIO_MESSAGE_QUEUE") or None
+socketio_channel = os.getenv("SOCKETIO_CHANNEL", "crm")
+socketio_options = {}
+if socketio_queue and socketio_queue.startswith(("redis://", "rediss://")):
+    socketio_options["client_manager"] = MsgpackRedisManager(socketio_queue, channel=socketio_channel)
+
+socketio = SocketIO(
+    app,
+    cors_allowed_origins=cors_origins,
+    async_mode="threading",
+    # Clientes do frontend já conectam só por WebSocket: sem long-polling
+    # e sem compressão por mensagem (payloads pequenos não compensam a CPU)
+    transports=["websocket"],
+    http_compression=False,
+    json=OrjsonJSON,
+    message_queue=socketio_queue,
+    channel=socketio_channel,
+    **socketio_options
+)
 
 # Inicializar serviço de notificações
 notification_service = NotificationService(socketio)
@@ -52,6 +92,7 @@ db = Database()
 extend_database_with_tags_sla(db)
 extend_database_with_ia(db)  # 🤖 Adicionar tabelas de IA
 whatsapp = WhatsAppService(db, socketio)
+whatsapp.start_health_monitor()
 validator = InputValidator()
 audit_logger = AuditLogger(db)
 
@@ -256,6 +297,7 @@ def create_user():
     data = request.json
     uid = db.create_user(data["username"], data["password"], data["name"], data["role"])
     if uid:
+        whatsapp.refresh_users()
         audit_logger.log_action(session["user_id"], "user_created", "user", uid, f"Usuário {data['username']}")
         return jsonify({"success": True, "user_id": uid})
     return jsonify({"error": "Usuário já existe"}), 400
@@ -268,6 +310,7 @@ def create_user():
 def update_user(user_id):
     data = request.json
     db.update_user(user_id, data["name"], data["role"], data.get("active", 1))
+    whatsapp.refresh_users()
     audit_logger.log_action(session["user_id"], "user_updated", "user", user_id, f"Usuário {user_id}")
     return jsonify({"success": True})
 
@@ -278,6 +321,7 @@ def update_user(user_id):
 @handle_errors
 def delete_user(user_id):
     db.delete_user(user_id)
+    whatsapp.refresh_users()
     audit_logger.log_action(session["user_id"], "user_deleted", "user", user_id, f"Usuário {user_id}")
     return jsonify({"success": True})
 
@@ -452,14 +496,16 @@ def send_message(lead_id):
     if not lead:
         return jsonify({"error": "Lead não encontrado"}), 404
 
-    success = whatsapp.send_message(lead["phone"], content, uid)
+    # send_message retorna o id da mensagem gravada (ou False)
+    message_id = whatsapp.send_message(lead["phone"], content, uid)
+    success = bool(message_id)
     if success:
         db.add_lead_log(lead_id, "mensagem_enviada", uname, content[:80])
         audit_logger.log_action(uid, "message_sent", "message", lead_id, f"Mensagem enviada para lead {lead_id}")
         
         # 📊 Sincronizar mensagem com Google Sheets
         sync_message_to_sheets({
-            'id': db.get_connection().cursor().lastrowid,
+            'id': message_id,
             'lead_id': lead_id,
             'lead_nome': lead['name'],
             'is_from_me': True,
@@ -895,9 +941,10 @@ def webhook_message():
         content = str(content).strip()
         name = str(name).strip()
         timestamp = datetime.now().isoformat()
+        preview = content[:100]  # prévia única para o print e o log da timeline
 
         print(f"📞 Telefone limpo: {phone}")
-        print(f"💬 Conteúdo: {content[:50]}...")
+        print(f"💬 Conteúdo: {preview:.50}...")
         print(f"👤 Nome: {name}")
 
         if not phone.isdigit():
@@ -921,15 +968,17 @@ def webhook_message():
         # 📊 Sincronizar lead com Google Sheets
         sync_lead_to_sheets(lead["id"])
 
-        # 🔹 Registra mensagem
-        db.add_message(lead["id"], "lead", name, content)
+        # 🔹 Registra mensagem + log de histórico (uma transação)
+        message_id = db.record_message_and_log(
+            lead["id"], "lead", name, content, "mensagem_recebida", preview
+        )
 
         # 🔔 Notificar nova mensagem
         notification_service.notify_new_message(lead, content, room='gestores')
         
         # 📊 Sincronizar mensagem com Google Sheets
         sync_message_to_sheets({
-            'id': db.get_connection().cursor().lastrowid,
+            'id': message_id,
             'lead_id': lead["id"],
             'lead_nome': name,
             'is_from_me': False,
@@ -938,9 +987,6 @@ def webhook_message():
             'status': 'recebida'
         })
 
-        # 🔹 Log de histórico
-        db.add_lead_log(lead["id"], "mensagem_recebida", name, content[:100])
-
         # 🤖 RESPOSTA AUTOMÁTICA DA IA
         if ia_assistant:
             try:
@@ -952,15 +998,15 @@ def webhook_message():
 
 
                     if success:
-                        # Registrar mensagem da IA no banco
-                        db.add_message(lead["id"], "ia", "Assistente Virtual", resposta_ia)
+                        # Registrar mensagem da IA + log da ação (uma transação)
+                        db.record_message_and_log(
+                            lead["id"], "ia", "Assistente Virtual", resposta_ia, "ia_resposta", resposta_ia[:100],
+                            user_name="IA Assistant"
+                        )
                         db.increment_ia_message_count(lead["id"])
 
-                        # Log da ação
-                        db.add_lead_log(lead["id"], "ia_resposta", "IA Assistant", resposta_ia[:100])
-
                         # Notificar via Socket.io
-                        socketio.emit("new_message", {
+                        whatsapp.queue_new_message({
                             "lead_id": lead["id"],
                             "phone": phone,
                             "name": "Assistente Virtual",
@@ -973,8 +1019,8 @@ def webhook_message():
             except Exception as e_ia:
                 print(f"⚠️ Erro na IA (não bloqueante): {e_ia}")
 
-        # 🔹 Emite atualização em tempo real
-        socketio.emit("new_message", {
+        # 🔹 Emite atualização em tempo real (agrupada em "new_messages")
+        whatsapp.queue_new_message({
             "lead_id": lead["id"],
             "phone": phone,
             "name": name,
@@ -1026,7 +1072,8 @@ def simulate_message():
 @app.route("/api/whatsapp/status", methods=["GET"])
 @login_required
 def whatsapp_status():
-    return jsonify(whatsapp.get_status())
+    # ?force=1 ignora o cache e consulta o VenomBot na hora
+    return jsonify(whatsapp.get_status(force=request.args.get("force") == "1"))
 
 # =======================
 # SOCKET.IO EVENTS
@@ -1361,4 +1408,4 @@ if __name__ == "__main__":
         print(f"📊 Google Sheets: {sheets_service.get_spreadsheet_url()}")
     print("=" * 60)
 
-    socketio.run(app, debug=False, host="0.0.0.0", port=5000)
\ No newline at end of file
+    socketio.run(app, debug=False, host="0.0.0.0", port=5000, request_handler=LowLatencyRequestHandler)
\ No newline at end of file
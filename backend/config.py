@@ -37,6 +37,8 @@ class Config:
     
     # Socket.io
     SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')  # ex: redis://localhost:6379/0
+    SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'crm')
     
     # Logs
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -1,10 +1,87 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import timezone
 import bcrypt
 import hashlib  # Manter temporariamente para migração de hashes antigos
 
+
+def _sql_timestamp(dt):
+    """
+    Converte um datetime para o formato do CURRENT_TIMESTAMP do SQLite
+    (UTC, 'YYYY-MM-DD HH:MM:SS'); None mantém o default da coluna
+    """
+    if dt is None:
+        return None
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ConnectionPool:
+    """
+    Pool LIFO de conexões SQLite reaproveitadas entre requisições
+
+    O servidor roda em modo threading (uma thread por requisição), então
+    conexões por thread seriam recriadas a cada request. Aqui as conexões
+    ociosas ficam numa pilha compartilhada: abrir o arquivo, ler o schema e
+    aplicar os PRAGMAs acontece uma vez por conexão, não por consulta.
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA cache_size=-65536",
+    )
+
+    def __init__(self, db_name, max_idle=8):
+        self.db_name = db_name
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _create(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=128)
+        conn.row_factory = sqlite3.Row
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão do pool e devolve ao final do bloco"""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._create()
+
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def close_all(self):
+        """Fecha as conexões ociosas"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
 class Database:
     def __init__(self, db_name="crm_whatsapp.db"):
         self.db_name = db_name
+        self.pool = ConnectionPool(db_name)
+        self.fts_enabled = False
+        self.leads_fts_enabled = False
+        self.lead_search_columns = ("name", "phone")
         self.init_db()
 
     def get_connection(self):
@@ -95,6 +172,28 @@ class Database:
 
         conn.commit()
 
+        # Índices dos filtros de busca (MessageSearcher / LeadSearcher)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_messages_lead_ts ON messages(lead_id, timestamp DESC)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages(sender_type, timestamp DESC)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_leads_status_upd ON leads(status, updated_at DESC)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_leads_assigned ON leads(assigned_to, updated_at DESC)")
+        # Busca por prefixo: LIKE 'x%' só usa índice com collation NOCASE; GLOB usa o BINARY
+        c.execute("CREATE INDEX IF NOT EXISTS idx_leads_name_nocase ON leads(name COLLATE NOCASE)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_leads_phone ON leads(phone)")
+
+        self._init_fts(c)
+        self._init_leads_fts(c)
+        conn.commit()
+
+        # Estatísticas para o planner: ANALYZE completo só na primeira vez,
+        # depois PRAGMA optimize reanalisa apenas o que mudou
+        c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if c.fetchone() is None:
+            c.execute("ANALYZE")
+        else:
+            c.execute("PRAGMA optimize")
+        conn.commit()
+
         # Usuário admin padrão
         c.execute("SELECT * FROM users WHERE username = 'admin'")
         if not c.fetchone():
@@ -103,6 +202,125 @@ class Database:
 
         conn.close()
 
+    def _init_fts(self, c):
+        """
+        Índice trigram (FTS5) sobre messages.content
+
+        A tabela virtual usa messages como conteúdo externo (não duplica o
+        texto) e é mantida por triggers. O tokenizer trigram indexa
+        substrings, então a busca mantém a semântica de LIKE '%termo%'
+        (inclusive pedaços de palavra e pontuação). Na primeira criação o
+        índice é reconstruído com as mensagens já existentes; um índice
+        antigo com outro tokenizer é recriado. Se o SQLite não tiver FTS5
+        trigram, as buscas continuam com LIKE.
+        """
+        c.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'")
+        row = c.fetchone()
+        exists = row is not None
+        if exists and "trigram" not in row["sql"]:
+            c.execute("DROP TABLE messages_fts")
+            for suffix in ("ai", "ad", "au"):
+                c.execute(f"DROP TRIGGER IF EXISTS messages_fts_{suffix}")
+            exists = False
+
+        try:
+            c.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    content,
+                    content='messages',
+                    content_rowid='id',
+                    tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ FTS5 trigram indisponível, busca de mensagens usará LIKE: {e}")
+            self.fts_enabled = False
+            return
+
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+        """)
+        c.execute("""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+                INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+            END
+        """)
+
+        if not exists:
+            c.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+        self.fts_enabled = True
+
+    def _init_leads_fts(self, c):
+        """
+        Índice trigram (FTS5) sobre nome/telefone/email dos leads
+
+        Um único MATCH substitui os LIKE '%termo%' por coluna na busca de
+        leads. O tokenizer trigram indexa substrings, então a semântica de
+        "contém" é mantida. A coluna email só entra se existir na tabela; se
+        o conjunto de colunas mudar, o índice é recriado.
+        """
+        c.execute("PRAGMA table_info(leads)")
+        lead_columns = {row["name"] for row in c.fetchall()}
+        columns = tuple(col for col in ("name", "phone", "email") if col in lead_columns)
+        self.lead_search_columns = columns
+
+        c.execute("PRAGMA table_info(leads_fts)")
+        existing = tuple(row["name"] for row in c.fetchall())
+        if existing and existing != columns:
+            c.execute("DROP TABLE leads_fts")
+            for suffix in ("ai", "ad", "au"):
+                c.execute(f"DROP TRIGGER IF EXISTS leads_fts_{suffix}")
+            existing = ()
+
+        cols = ", ".join(columns)
+        new_cols = ", ".join(f"new.{col}" for col in columns)
+        old_cols = ", ".join(f"old.{col}" for col in columns)
+
+        try:
+            c.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5(
+                    {cols},
+                    content='leads',
+                    content_rowid='id',
+                    tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ FTS5 trigram indisponível, busca de leads usará LIKE: {e}")
+            self.leads_fts_enabled = False
+            return
+
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS leads_fts_ai AFTER INSERT ON leads BEGIN
+                INSERT INTO leads_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        """)
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS leads_fts_ad AFTER DELETE ON leads BEGIN
+                INSERT INTO leads_fts(leads_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+            END
+        """)
+        c.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS leads_fts_au AFTER UPDATE OF {cols} ON leads BEGIN
+                INSERT INTO leads_fts(leads_fts, rowid, {cols}) VALUES ('delete', old.id, {old_cols});
+                INSERT INTO leads_fts(rowid, {cols}) VALUES (new.id, {new_cols});
+            END
+        """)
+
+        if not existing:
+            c.execute("INSERT INTO leads_fts(leads_fts) VALUES ('rebuild')")
+
+        self.leads_fts_enabled = True
+
     # =======================
     # USUÁRIOS
     # =======================
@@ -332,16 +550,75 @@ class Database:
     # =======================
     # MENSAGENS / LOGS / NOTAS
     # =======================
-    def add_message(self, lead_id, sender_type, sender_name, content):
+    def add_message(self, lead_id, sender_type, sender_name, content, created_at=None):
         conn = self.get_connection()
         c = conn.cursor()
         c.execute("""
-            INSERT INTO messages (lead_id, sender_type, sender_name, content)
-            VALUES (?, ?, ?, ?)
-        """, (lead_id, sender_type, sender_name, content))
+            INSERT INTO messages (lead_id, sender_type, sender_name, content, timestamp)
+            VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        """, (lead_id, sender_type, sender_name, content, _sql_timestamp(created_at)))
         conn.commit()
         conn.close()
 
+    def record_message_and_log(self, lead_id, sender_type, sender_name, content, action, details="",
+                               user_name=None, created_at=None):
+        """
+        Grava a mensagem e o log da timeline do lead em uma única transação
+
+        Mesmo efeito de add_message + add_lead_log, mas com um commit só.
+        O user_name do log é o remetente, a menos que seja informado.
+        created_at (datetime) vale para os dois registros; sem ele, usa o
+        CURRENT_TIMESTAMP do banco. Retorna o id da mensagem.
+        """
+        ts = _sql_timestamp(created_at)
+        conn = self.get_connection()
+        try:
+            with conn:
+                c = conn.execute("""
+                    INSERT INTO messages (lead_id, sender_type, sender_name, content, timestamp)
+                    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                """, (lead_id, sender_type, sender_name, content, ts))
+                message_id = c.lastrowid
+                conn.execute("""
+                    INSERT INTO lead_logs (lead_id, action, user_name, details, timestamp)
+                    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                """, (lead_id, action, user_name or sender_name, details, ts))
+        finally:
+            conn.close()
+        return message_id
+
+    def add_messages_bulk(self, entries):
+        """
+        Grava várias mensagens + logs da timeline em uma única transação
+
+        Cada entrada é um dict com os argumentos de record_message_and_log
+        (lead_id, sender_type, sender_name, content, action e, opcionais,
+        details, user_name, created_at). Usa executemany: um commit para
+        o lote inteiro.
+        """
+        if not entries:
+            return
+        messages = []
+        logs = []
+        for e in entries:
+            ts = _sql_timestamp(e.get("created_at"))
+            messages.append((e["lead_id"], e["sender_type"], e["sender_name"], e["content"], ts))
+            logs.append((e["lead_id"], e["action"], e.get("user_name") or e["sender_name"],
+                         e.get("details", ""), ts))
+        conn = self.get_connection()
+        try:
+            with conn:
+                conn.executemany("""
+                    INSERT INTO messages (lead_id, sender_type, sender_name, content, timestamp)
+                    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                """, messages)
+                conn.executemany("""
+                    INSERT INTO lead_logs (lead_id, action, user_name, details, timestamp)
+                    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                """, logs)
+        finally:
+            conn.close()
+
     def get_messages_by_lead(self, lead_id):
         conn = self.get_connection()
         c = conn.cursor()
@@ -372,13 +649,13 @@ class Database:
         conn.close()
         return notes
 
-    def add_lead_log(self, lead_id, action, user_name, details=""):
+    def add_lead_log(self, lead_id, action, user_name, details="", created_at=None):
         conn = self.get_connection()
         c = conn.cursor()
         c.execute("""
-            INSERT INTO lead_logs (lead_id, action, user_name, details)
-            VALUES (?, ?, ?, ?)
-        """, (lead_id, action, user_name, details))
+            INSERT INTO lead_logs (lead_id, action, user_name, details, timestamp)
+            VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+        """, (lead_id, action, user_name, details, _sql_timestamp(created_at)))
         conn.commit()
         conn.close()
 
@@ -10,11 +10,17 @@ Responsável por:
 import json
 import os
 from datetime import datetime, timedelta
-from openai import OpenAI
 import re
 
 
 class IAAssistant:
+    # Limites da chamada à OpenAI: o lead está esperando a resposta no
+    # WhatsApp, então é melhor cair no fluxo sequencial do que travar.
+    # O SDK refaz com backoff exponencial em 429, 5xx, timeout e erro de conexão
+    OPENAI_TIMEOUT = 30.0  # segundos
+    OPENAI_CONNECT_TIMEOUT = 5.0
+    OPENAI_MAX_RETRIES = 3
+
     def __init__(self, database, config_path="ia_config.json"):
         """
         Inicializa o assistente de IA
@@ -31,7 +37,15 @@ class IAAssistant:
         self.openai_habilitada = bool(api_key)
 
         if self.openai_habilitada:
-            self.client = OpenAI(api_key=api_key)
+            # Import tardio: o SDK (openai + httpx + pydantic) só é carregado
+            # quando há chave configurada
+            import httpx
+            from openai import OpenAI
+            self.client = OpenAI(
+                api_key=api_key,
+                timeout=httpx.Timeout(self.OPENAI_TIMEOUT, connect=self.OPENAI_CONNECT_TIMEOUT),
+                max_retries=self.OPENAI_MAX_RETRIES
+            )
             print("✅ OpenAI inicializada")
         else:
             print("⚠️ OPENAI_API_KEY não encontrada - usando fallback")
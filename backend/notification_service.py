@@ -10,9 +10,101 @@ Tipos de notificações:
 - lead_atribuido: Lead atribuído ao vendedor
 """
 
-from datetime import datetime
-from typing import Dict, Any, List
+import collections
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Dict, Any, List, Optional, Tuple, Union
 from flask_socketio import SocketIO
+from socketio import PubSubManager
+
+logger = logging.getLogger(__name__)
+
+
+# Cache do último timestamp ISO gerado: (segundo, string)
+_iso_cache = (0, '')
+
+
+def _now_iso() -> str:
+    """
+    Retorna o timestamp atual em ISO 8601 (UTC)
+    
+    A string só é recriada quando o segundo muda, evitando montar um
+    datetime e formatá-lo a cada notificação em rajadas.
+    """
+    global _iso_cache
+    sec = int(time.time())
+    cached_sec, cached_iso = _iso_cache
+    if sec != cached_sec:
+        cached_iso = datetime.fromtimestamp(sec, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        _iso_cache = (sec, cached_iso)
+    return cached_iso
+
+
+# Textos pré-definidos das notificações
+_NEW_LEAD_TITLE = '🆕 Novo Lead'
+_NEW_LEAD_MSG = 'Novo lead chegou: {name}'
+_NEW_MESSAGE_TITLE = '💬 Nova Mensagem'
+_NEW_MESSAGE_MSG = '{name}: {preview}{ellipsis}'
+_SLA_ALERT_TITLE = '⚠️ Alerta de SLA'
+_SLA_ALERT_MSG = 'Lead {name} sem resposta há {minutes} minutos'
+_STATUS_CHANGED_TITLE = '✅ Status Alterado'
+_STATUS_CHANGED_MSG = '{name} mudou de {old} para {new}'
+_LEAD_ASSIGNED_TITLE = '📞 Lead Atribuído'
+_LEAD_ASSIGNED_MSG = 'Lead {name} atribuído para {vendedor}'
+_LEAD_TRANSFERRED_TITLE = '🔄 Lead Transferido'
+_LEAD_TRANSFERRED_MSG = 'Lead {name} transferido de {from_vendedor} para {to_vendedor}'
+
+# Status em português (somente leitura)
+_STATUS_MAP = MappingProxyType({
+    'novo': 'Novo',
+    'contatado': 'Contatado',
+    'qualificado': 'Qualificado',
+    'negociacao': 'Em Negociação',
+    'ganho': 'Ganho',
+    'perdido': 'Perdido'
+})
+
+# Escolhas indexadas por bool: [False, True]
+_PRIO_WON = ('low', 'high')
+_SOUND_WON = ('status_changed', 'lead_won')
+_PRIO_SLA = ('high', 'urgent')
+
+
+# Pool de dicts reaproveitados na montagem das notificações
+_POOL = collections.deque(maxlen=1024)
+
+
+def _borrow() -> Dict[str, Any]:
+    """Retira um dict vazio do pool (ou cria um novo)"""
+    try:
+        return _POOL.pop()
+    except IndexError:
+        return {}
+
+
+def _release(*dicts: Dict[str, Any]):
+    """Limpa os dicts e devolve ao pool"""
+    for d in dicts:
+        d.clear()
+        _POOL.append(d)
+
+
+def _view(lead: Dict[str, Any]) -> Tuple[Any, Optional[str], Optional[str], Optional[str]]:
+    """
+    Normaliza o lead uma única vez: (id, nome, telefone, status)
+    
+    Aceita tanto as chaves em inglês (name/phone) quanto em português
+    (nome/telefone).
+    """
+    return (
+        lead['id'],
+        lead.get('name') or lead.get('nome'),
+        lead.get('phone') or lead.get('telefone'),
+        lead.get('status')
+    )
 
 
 class NotificationService:
@@ -34,6 +126,10 @@ class NotificationService:
     TYPE_LEAD_ASSIGNED = 'lead_atribuido'
     TYPE_LEAD_TRANSFERRED = 'lead_transferido'
     
+    # Deduplicação (retries de webhook, entregas duplicadas)
+    DEDUP_TTL = 2.0  # segundos
+    DEDUP_MAX_SIZE = 4096
+    
     def __init__(self, socketio: SocketIO):
         """
         Inicializa o serviço de notificações
@@ -42,7 +138,102 @@ class NotificationService:
             socketio: Instância do SocketIO
         """
         self.socketio = socketio
-        print("🔔 Serviço de notificações inicializado")
+        self._recent = {}
+        self._recent_lock = threading.Lock()
+        logger.info("🔔 Serviço de notificações inicializado")
+    
+    @staticmethod
+    def _log_sent(notification_type: str, lead_id: Any):
+        """Registra o envio (formatação só acontece com DEBUG ativo)"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔔 Notificação enviada: %s lead %s", notification_type, lead_id)
+    
+    def _is_duplicate(self, notification_type: str, lead_id: Any, discriminator: Any = None) -> bool:
+        """
+        Verifica se a mesma notificação já foi enviada no mesmo segundo
+        
+        A chave é (tipo, lead, discriminador, segundo). O discriminador
+        diferencia eventos legítimos do mesmo lead no mesmo segundo
+        (ex: duas mensagens com conteúdos diferentes).
+        
+        Returns:
+            True se a notificação deve ser descartada
+        """
+        now = time.time()
+        key = (notification_type, lead_id, discriminator, int(now))
+        cutoff = now - self.DEDUP_TTL
+        
+        with self._recent_lock:
+            if key in self._recent:
+                return True
+            
+            # Entradas ficam em ordem de inserção: remove expiradas do início
+            while self._recent:
+                oldest = next(iter(self._recent))
+                if self._recent[oldest] > cutoff and len(self._recent) < self.DEDUP_MAX_SIZE:
+                    break
+                del self._recent[oldest]
+            
+            self._recent[key] = now
+            return False
+    
+    def _has_subscribers(self, *rooms: str) -> bool:
+        """
+        Verifica se alguma das salas tem clientes conectados
+        
+        Sem ninguém ouvindo, a notificação nem chega a ser montada. Com
+        fila de mensagens (Redis) os clientes podem estar em outro worker
+        e a lista local de salas não é confiável, então assume que há.
+        """
+        manager = self.socketio.server.manager
+        if isinstance(manager, PubSubManager):
+            return True
+        
+        namespace_rooms = manager.rooms.get('/')
+        if not namespace_rooms:
+            return False
+        return any(namespace_rooms.get(room) for room in rooms)
+    
+    def _publish(self, rooms: List[str], notification: Dict[str, Any]):
+        """
+        Envia a notificação para várias salas em um único emit
+        
+        O python-socketio aceita uma lista de salas em `to`: o pacote é
+        serializado uma única vez e cada cliente recebe uma só cópia,
+        mesmo que esteja em mais de uma das salas.
+        
+        Args:
+            rooms: Salas de destino
+            notification: Payload da notificação
+        """
+        self.socketio.emit('notification', notification, to=rooms)
+    
+    def _send(self, rooms: List[str], notification_type: str, priority: str, title: str,
+              message: str, sound: str, id_prefix: str, lead_id: Any, data: Dict[str, Any]):
+        """
+        Monta a notificação em um dict do pool, envia e devolve ao pool
+        
+        O emit serializa o payload antes de retornar, então `data` (que
+        também deve vir de _borrow()) e a notificação podem ser reciclados
+        logo em seguida.
+        """
+        notification = _borrow()
+        try:
+            notification['id'] = f"{id_prefix}_{lead_id}_{time.time()}"
+            notification['type'] = notification_type
+            notification['priority'] = priority
+            notification['title'] = title
+            notification['message'] = message
+            notification['data'] = data
+            notification['timestamp'] = _now_iso()
+            notification['read'] = False
+            notification['sound'] = sound
+            
+            self._publish(rooms, notification)
+        finally:
+            _release(data, notification)
+        
+        self._log_sent(notification_type, lead_id)
     
     def notify_new_lead(self, lead: Dict[str, Any], room: str = 'gestores'):
         """
@@ -52,25 +243,24 @@ class NotificationService:
             lead: Dados do lead
             room: Sala para enviar (gestores, vendedores, etc)
         """
-        notification = {
-            'id': f"lead_{lead['id']}_{datetime.now().timestamp()}",
-            'type': self.TYPE_NEW_LEAD,
-            'priority': self.PRIORITY_HIGH,
-            'title': '🆕 Novo Lead',
-            'message': f"Novo lead chegou: {lead.get('name', lead.get('nome', 'Sem nome'))}",
-            'data': {
-                'lead_id': lead['id'],
-                'lead_name': lead.get('name', lead.get('nome')),
-                'lead_phone': lead.get('phone', lead.get('telefone')),
-                'status': lead.get('status')
-            },
-            'timestamp': datetime.now().isoformat(),
-            'read': False,
-            'sound': 'new_lead'
-        }
+        if not self._has_subscribers(room):
+            return
+        
+        lead_id, name, phone, status = _view(lead)
+        if self._is_duplicate(self.TYPE_NEW_LEAD, lead_id):
+            return
+        
+        data = _borrow()
+        data['lead_id'] = lead_id
+        data['lead_name'] = name
+        data['lead_phone'] = phone
+        data['status'] = status
         
-        self.socketio.emit('notification', notification, room=room)
-        print(f"🔔 Notificação enviada: Novo lead {lead['id']}")
+        self._send(
+            [room], self.TYPE_NEW_LEAD, self.PRIORITY_HIGH, _NEW_LEAD_TITLE,
+            _NEW_LEAD_MSG.format_map({'name': name or 'Sem nome'}),
+            'new_lead', 'lead', lead_id, data
+        )
     
     def notify_new_message(self, lead: Dict[str, Any], message: str, room: str = 'gestores'):
         """
@@ -81,24 +271,28 @@ class NotificationService:
             message: Conteúdo da mensagem
             room: Sala para enviar
         """
-        notification = {
-            'id': f"msg_{lead['id']}_{datetime.now().timestamp()}",
-            'type': self.TYPE_NEW_MESSAGE,
-            'priority': self.PRIORITY_MEDIUM,
-            'title': '💬 Nova Mensagem',
-            'message': f"{lead.get('name', lead.get('nome', 'Lead'))}: {message[:50]}{'...' if len(message) > 50 else ''}",
-            'data': {
-                'lead_id': lead['id'],
-                'lead_name': lead.get('name', lead.get('nome')),
-                'message_preview': message[:100]
-            },
-            'timestamp': datetime.now().isoformat(),
-            'read': False,
-            'sound': 'new_message'
-        }
+        if not self._has_subscribers(room):
+            return
+        
+        lead_id, name, _, _ = _view(lead)
+        if self._is_duplicate(self.TYPE_NEW_MESSAGE, lead_id, message):
+            return
+        
+        preview = message[:100]
+        data = _borrow()
+        data['lead_id'] = lead_id
+        data['lead_name'] = name
+        data['message_preview'] = preview
         
-        self.socketio.emit('notification', notification, room=room)
-        print(f"🔔 Notificação enviada: Nova mensagem do lead {lead['id']}")
+        self._send(
+            [room], self.TYPE_NEW_MESSAGE, self.PRIORITY_MEDIUM, _NEW_MESSAGE_TITLE,
+            _NEW_MESSAGE_MSG.format_map({
+                'name': name or 'Lead',
+                'preview': preview[:50],
+                'ellipsis': '...' if len(message) > 50 else ''
+            }),
+            'new_message', 'msg', lead_id, data
+        )
     
     def notify_sla_alert(self, lead: Dict[str, Any], minutes_waiting: int, room: str = 'gestores'):
         """
@@ -109,24 +303,23 @@ class NotificationService:
             minutes_waiting: Minutos esperando resposta
             room: Sala para enviar
         """
-        notification = {
-            'id': f"sla_{lead['id']}_{datetime.now().timestamp()}",
-            'type': self.TYPE_SLA_ALERT,
-            'priority': self.PRIORITY_URGENT if minutes_waiting > 60 else self.PRIORITY_HIGH,
-            'title': '⚠️ Alerta de SLA',
-            'message': f"Lead {lead.get('name', lead.get('nome'))} sem resposta há {minutes_waiting} minutos",
-            'data': {
-                'lead_id': lead['id'],
-                'lead_name': lead.get('name', lead.get('nome')),
-                'minutes_waiting': minutes_waiting
-            },
-            'timestamp': datetime.now().isoformat(),
-            'read': False,
-            'sound': 'sla_alert'
-        }
+        if not self._has_subscribers(room):
+            return
+        
+        lead_id, name, _, _ = _view(lead)
+        if self._is_duplicate(self.TYPE_SLA_ALERT, lead_id):
+            return
+        
+        data = _borrow()
+        data['lead_id'] = lead_id
+        data['lead_name'] = name
+        data['minutes_waiting'] = minutes_waiting
         
-        self.socketio.emit('notification', notification, room=room)
-        print(f"🔔 Notificação enviada: Alerta SLA lead {lead['id']}")
+        self._send(
+            [room], self.TYPE_SLA_ALERT, _PRIO_SLA[minutes_waiting > 60], _SLA_ALERT_TITLE,
+            _SLA_ALERT_MSG.format_map({'name': name, 'minutes': minutes_waiting}),
+            'sla_alert', 'sla', lead_id, data
+        )
     
     def notify_status_changed(self, lead: Dict[str, Any], old_status: str, new_status: str, room: str = 'gestores'):
         """
@@ -138,35 +331,29 @@ class NotificationService:
             new_status: Novo status
             room: Sala para enviar
         """
-        # Mapear status para português
-        status_map = {
-            'novo': 'Novo',
-            'contatado': 'Contatado',
-            'qualificado': 'Qualificado',
-            'negociacao': 'Em Negociação',
-            'ganho': 'Ganho',
-            'perdido': 'Perdido'
-        }
+        if not self._has_subscribers(room):
+            return
         
-        notification = {
-            'id': f"status_{lead['id']}_{datetime.now().timestamp()}",
-            'type': self.TYPE_STATUS_CHANGED,
-            'priority': self.PRIORITY_LOW if new_status != 'ganho' else self.PRIORITY_HIGH,
-            'title': '✅ Status Alterado',
-            'message': f"{lead.get('name', lead.get('nome'))} mudou de {status_map.get(old_status, old_status)} para {status_map.get(new_status, new_status)}",
-            'data': {
-                'lead_id': lead['id'],
-                'lead_name': lead.get('name', lead.get('nome')),
-                'old_status': old_status,
-                'new_status': new_status
-            },
-            'timestamp': datetime.now().isoformat(),
-            'read': False,
-            'sound': 'status_changed' if new_status != 'ganho' else 'lead_won'
-        }
+        lead_id, name, _, _ = _view(lead)
+        if self._is_duplicate(self.TYPE_STATUS_CHANGED, lead_id, new_status):
+            return
+        won = new_status == 'ganho'
+        
+        data = _borrow()
+        data['lead_id'] = lead_id
+        data['lead_name'] = name
+        data['old_status'] = old_status
+        data['new_status'] = new_status
         
-        self.socketio.emit('notification', notification, room=room)
-        print(f"🔔 Notificação enviada: Status mudou lead {lead['id']}")
+        self._send(
+            [room], self.TYPE_STATUS_CHANGED, _PRIO_WON[won], _STATUS_CHANGED_TITLE,
+            _STATUS_CHANGED_MSG.format_map({
+                'name': name,
+                'old': _STATUS_MAP.get(old_status, old_status),
+                'new': _STATUS_MAP.get(new_status, new_status)
+            }),
+            _SOUND_WON[won], 'status', lead_id, data
+        )
     
     def notify_lead_assigned(self, lead: Dict[str, Any], vendedor_name: str, vendedor_id: int, room: str = 'gestores'):
         """
@@ -178,30 +365,26 @@ class NotificationService:
             vendedor_id: ID do vendedor
             room: Sala para enviar
         """
-        notification = {
-            'id': f"assign_{lead['id']}_{datetime.now().timestamp()}",
-            'type': self.TYPE_LEAD_ASSIGNED,
-            'priority': self.PRIORITY_MEDIUM,
-            'title': '📞 Lead Atribuído',
-            'message': f"Lead {lead.get('name', lead.get('nome'))} atribuído para {vendedor_name}",
-            'data': {
-                'lead_id': lead['id'],
-                'lead_name': lead.get('name', lead.get('nome')),
-                'vendedor_name': vendedor_name,
-                'vendedor_id': vendedor_id
-            },
-            'timestamp': datetime.now().isoformat(),
-            'read': False,
-            'sound': 'lead_assigned'
-        }
+        if not self._has_subscribers('gestores', f'user_{vendedor_id}'):
+            return
         
-        # Envia para gestores
-        self.socketio.emit('notification', notification, room='gestores')
+        lead_id, name, _, _ = _view(lead)
+        if self._is_duplicate(self.TYPE_LEAD_ASSIGNED, lead_id, vendedor_id):
+            return
         
-        # Envia para o vendedor específico
-        self.socketio.emit('notification', notification, room=f'user_{vendedor_id}')
+        data = _borrow()
+        data['lead_id'] = lead_id
+        data['lead_name'] = name
+        data['vendedor_name'] = vendedor_name
+        data['vendedor_id'] = vendedor_id
         
-        print(f"🔔 Notificação enviada: Lead {lead['id']} atribuído")
+        # Envia para gestores e para o vendedor específico
+        self._send(
+            ['gestores', f'user_{vendedor_id}'], self.TYPE_LEAD_ASSIGNED, self.PRIORITY_MEDIUM,
+            _LEAD_ASSIGNED_TITLE,
+            _LEAD_ASSIGNED_MSG.format_map({'name': name, 'vendedor': vendedor_name}),
+            'lead_assigned', 'assign', lead_id, data
+        )
     
     def notify_lead_transferred(self, lead: Dict[str, Any], from_vendedor: str, to_vendedor: str, to_vendedor_id: int, room: str = 'gestores'):
         """
@@ -214,33 +397,34 @@ class NotificationService:
             to_vendedor_id: ID do vendedor destino
             room: Sala para enviar
         """
-        notification = {
-            'id': f"transfer_{lead['id']}_{datetime.now().timestamp()}",
-            'type': self.TYPE_LEAD_TRANSFERRED,
-            'priority': self.PRIORITY_MEDIUM,
-            'title': '🔄 Lead Transferido',
-            'message': f"Lead {lead.get('name', lead.get('nome'))} transferido de {from_vendedor} para {to_vendedor}",
-            'data': {
-                'lead_id': lead['id'],
-                'lead_name': lead.get('name', lead.get('nome')),
-                'from_vendedor': from_vendedor,
-                'to_vendedor': to_vendedor
-            },
-            'timestamp': datetime.now().isoformat(),
-            'read': False,
-            'sound': 'lead_transferred'
-        }
+        if not self._has_subscribers('gestores', f'user_{to_vendedor_id}'):
+            return
         
-        # Envia para gestores
-        self.socketio.emit('notification', notification, room='gestores')
+        lead_id, name, _, _ = _view(lead)
+        if self._is_duplicate(self.TYPE_LEAD_TRANSFERRED, lead_id, to_vendedor_id):
+            return
         
-        # Envia para o novo vendedor
-        self.socketio.emit('notification', notification, room=f'user_{to_vendedor_id}')
+        data = _borrow()
+        data['lead_id'] = lead_id
+        data['lead_name'] = name
+        data['from_vendedor'] = from_vendedor
+        data['to_vendedor'] = to_vendedor
         
-        print(f"🔔 Notificação enviada: Lead {lead['id']} transferido")
+        # Envia para gestores e para o novo vendedor
+        self._send(
+            ['gestores', f'user_{to_vendedor_id}'], self.TYPE_LEAD_TRANSFERRED, self.PRIORITY_MEDIUM,
+            _LEAD_TRANSFERRED_TITLE,
+            _LEAD_TRANSFERRED_MSG.format_map({
+                'name': name,
+                'from_vendedor': from_vendedor,
+                'to_vendedor': to_vendedor
+            }),
+            'lead_transferred', 'transfer', lead_id, data
+        )
     
     def notify_custom(self, title: str, message: str, notification_type: str = 'info', 
-                     priority: str = PRIORITY_MEDIUM, data: Dict = None, room: str = 'gestores'):
+                     priority: str = PRIORITY_MEDIUM, data: Dict = None,
+                     room: Union[str, List[str]] = 'gestores'):
         """
         Envia notificação customizada
         
@@ -250,22 +434,23 @@ class NotificationService:
             notification_type: Tipo personalizado
             priority: Prioridade
             data: Dados adicionais
-            room: Sala para enviar
+            room: Sala (ou lista de salas) para enviar
         """
         notification = {
-            'id': f"custom_{datetime.now().timestamp()}",
+            'id': f"custom_{time.time()}",
             'type': notification_type,
             'priority': priority,
             'title': title,
             'message': message,
             'data': data or {},
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': _now_iso(),
             'read': False,
             'sound': 'default'
         }
         
-        self.socketio.emit('notification', notification, room=room)
-        print(f"🔔 Notificação customizada enviada: {title}")
+        self._publish([room] if isinstance(room, str) else room, notification)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔔 Notificação customizada enviada: %s", title)
     
     def get_notification_stats(self) -> Dict[str, int]:
         """
@@ -2,10 +2,13 @@
 Rotas Flask para sistema de qualificação por IA
 Integra WhatsApp -> IA -> CRM
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from functools import wraps
 from typing import Dict
 import asyncio
 import os
+import threading
+import orjson
 
 from ..ai_qualification.engine import QualificationEngine
 from ..ai_qualification.providers.openai_provider import OpenAIProvider
@@ -16,12 +19,67 @@ from ..services.whatsapp_service import WhatsAppService
 # Blueprint
 ai_bp = Blueprint('ai', __name__, url_prefix='/api/ai')
 
+# Event loop persistente para as rotas assíncronas
+# O Flask (WSGI) criaria um loop novo a cada requisição via asgiref
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, name='ai-webhook-loop', daemon=True).start()
+
+
+def run_on_loop(f):
+    """
+    Executa uma view assíncrona no loop compartilhado
+    
+    A task herda o contexto (contextvars) da thread da requisição,
+    então `request` e `jsonify` continuam funcionando dentro da view.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        return asyncio.run_coroutine_threadsafe(f(*args, **kwargs), _loop).result()
+    return decorated
+
 # Inicializa engine (em produção, usar factory pattern)
 ai_provider = OpenAIProvider(
     api_key=os.getenv('OPENAI_API_KEY'),
     model=os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
 )
 
+# Conexões abertas antecipadamente com a API da OpenAI
+PREWARM_CONNECTIONS = 4
+
+
+async def _prewarm_ai_provider():
+    """
+    Abre conexões com a OpenAI antes do primeiro webhook
+    
+    O client HTTP abre a conexão TLS apenas na primeira chamada; fazendo
+    algumas requisições leves no boot, o pool já fica com conexões
+    keep-alive prontas e o primeiro lead não paga o handshake.
+    """
+    client = getattr(ai_provider, 'client', None)
+    if client is None:
+        return
+    
+    results = await asyncio.gather(
+        *(client.models.list() for _ in range(PREWARM_CONNECTIONS)),
+        return_exceptions=True
+    )
+    failures = [r for r in results if isinstance(r, Exception)]
+    if failures:
+        print(f"⚠️ Pré-aquecimento da OpenAI falhou: {failures[0]}")
+
+
+def _log_prewarm_error(future):
+    """Loga erros do pré-aquecimento que escapam do gather (ex: client síncrono)"""
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        print(f"⚠️ Pré-aquecimento da OpenAI falhou: {error}")
+
+
+if os.getenv('OPENAI_API_KEY'):
+    asyncio.run_coroutine_threadsafe(_prewarm_ai_provider(), _loop).add_done_callback(_log_prewarm_error)
+
 qualification_engine = QualificationEngine(
     ai_provider=ai_provider,
     business_type=os.getenv('BUSINESS_TYPE', 'services'),
@@ -38,6 +96,7 @@ whatsapp_service = WhatsAppService()
 
 
 @ai_bp.route('/webhook/whatsapp', methods=['POST'])
+@run_on_loop
 async def whatsapp_webhook():
     """
     Webhook para receber mensagens do WhatsApp
@@ -64,18 +123,24 @@ async def whatsapp_webhook():
             metadata={'contact_name': contact_name}
         )
         
-        # Envia resposta via WhatsApp
-        await whatsapp_service.send_message(
-            phone=phone,
-            message=result['response']
-        )
-        
-        # Se qualificado ou escalado, envia para CRM
+        # Envia resposta via WhatsApp e, se qualificado ou escalado,
+        # cria o lead no CRM em paralelo
         if result.get('should_send_to_crm'):
-            crm_lead = await lead_service.create_from_ai_qualification(
-                result['crm_data']
+            _, crm_lead = await asyncio.gather(
+                whatsapp_service.send_message(
+                    phone=phone,
+                    message=result['response']
+                ),
+                lead_service.create_from_ai_qualification(
+                    result['crm_data']
+                )
             )
             result['crm_lead_id'] = crm_lead['id']
+        else:
+            await whatsapp_service.send_message(
+                phone=phone,
+                message=result['response']
+            )
         
         return jsonify({
             'success': True,
@@ -110,30 +175,36 @@ def get_stats():
 
 @ai_bp.route('/conversations/active', methods=['GET'])
 def get_active_conversations():
-    """Lista conversas ativas"""
-    try:
-        conversations = []
-        for phone, conv in qualification_engine.active_conversations.items():
-            conversations.append({
-                'phone': phone,
-                'status': conv.status.value,
-                'score': conv.qualification_score,
-                'attempts': conv.attempts,
-                'collected_data': conv.collected_data,
-                'messages_count': len(conv.messages),
-                'started_at': conv.started_at.isoformat()
-            })
-        
-        return jsonify({
-            'success': True,
-            'conversations': conversations,
-            'total': len(conversations)
-        })
-    except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        }), 500
+    """
+    Lista conversas ativas
+    
+    A resposta é enviada em streaming: cada conversa é serializada e
+    entregue conforme é lida, sem montar a lista inteira em memória.
+    Como o status HTTP já foi enviado, um erro no meio do caminho fecha
+    o JSON com success=false e o campo error.
+    """
+    def generate():
+        yield '{"conversations":['
+        total = 0
+        try:
+            for phone, conv in list(qualification_engine.active_conversations.items()):
+                item = orjson.dumps({
+                    'phone': phone,
+                    'status': conv.status.value,
+                    'score': conv.qualification_score,
+                    'attempts': conv.attempts,
+                    'collected_data': conv.collected_data,
+                    'messages_count': len(conv.messages),
+                    'started_at': conv.started_at.isoformat()
+                }).decode()
+                yield ',' + item if total else item
+                total += 1
+        except Exception as e:
+            yield f'],"total":{total},"success":false,"error":{orjson.dumps(str(e)).decode()}}}'
+            return
+        yield f'],"total":{total},"success":true}}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 
 @ai_bp.route('/conversations/<phone>', methods=['GET'])
@@ -189,6 +260,7 @@ def end_conversation(phone: str):
 
 
 @ai_bp.route('/conversations/<phone>/escalate', methods=['POST'])
+@run_on_loop
 async def escalate_conversation(phone: str):
     """Escala conversa para atendimento humano manualmente"""
     try:
@@ -229,6 +301,7 @@ async def escalate_conversation(phone: str):
 
 
 @ai_bp.route('/test', methods=['POST'])
+@run_on_loop
 async def test_qualification():
     """
     Endpoint para testar o sistema sem WhatsApp
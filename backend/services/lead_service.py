@@ -4,12 +4,99 @@ Extensão do LeadService original
 """
 from datetime import datetime
 from typing import Dict, List, Optional
-import json
+import asyncio
+import collections
+import logging
+import time
+import orjson
+
+logger = logging.getLogger(__name__)
+
+
+# Fila de efeitos colaterais (notificação + auditoria), processada em
+# segundo plano para não atrasar a resposta do webhook
+SIDE_EFFECTS_QUEUE_SIZE = 10_000
+_side_effects_q: Optional[asyncio.Queue] = None
+_side_effects_worker: Optional[asyncio.Task] = None
+
+
+async def _side_effects_loop(queue: asyncio.Queue):
+    """Consome a fila de efeitos colaterais"""
+    while True:
+        fn, arg = await queue.get()
+        try:
+            await fn(arg)
+        except Exception as e:
+            logger.warning("⚠️ Erro em tarefa de segundo plano do LeadService: %s", e)
+        finally:
+            queue.task_done()
+
+
+def _enqueue_side_effect(fn, arg):
+    """
+    Agenda `await fn(arg)` na fila de segundo plano
+    
+    A fila e o worker são criados no loop em execução na primeira chamada
+    (e recriados se o loop mudar). Com a fila cheia, o item é descartado
+    em vez de bloquear quem chamou.
+    """
+    global _side_effects_q, _side_effects_worker
+    loop = asyncio.get_running_loop()
+    
+    if _side_effects_worker is None or _side_effects_worker.get_loop() is not loop:
+        _side_effects_q = asyncio.Queue(maxsize=SIDE_EFFECTS_QUEUE_SIZE)
+        _side_effects_worker = loop.create_task(_side_effects_loop(_side_effects_q))
+    
+    try:
+        _side_effects_q.put_nowait((fn, arg))
+    except asyncio.QueueFull:
+        logger.warning("⚠️ Fila de efeitos do LeadService cheia; descartando %s", fn.__name__)
 
 
 class LeadService:
     """Serviço para gerenciamento de leads"""
     
+    # Micro-batching de INSERTs em rajadas de qualificação
+    INSERT_BATCH_SIZE = 64
+    INSERT_BATCH_DELAY = 0.05  # segundos
+    
+    LEAD_COLUMNS = (
+        'phone', 'name', 'status', 'source', 'priority',
+        'tags', 'custom_fields', 'notes', 'qualification_score',
+        'qualified_at', 'created_at', 'assigned_to'
+    )
+    
+    LEAD_NOTES_DDL = (
+        """
+        CREATE TABLE IF NOT EXISTS lead_notes (
+            id BIGSERIAL PRIMARY KEY,
+            lead_id BIGINT NOT NULL REFERENCES leads(id),
+            ts TIMESTAMP NOT NULL,
+            note TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_lead_notes_lead_ts ON lead_notes (lead_id, ts)",
+    )
+    
+    # Auditoria: buffer circular gravado em lotes por uma task de fundo
+    AUDIT_RING_SIZE = 65536
+    AUDIT_BATCH_SIZE = 256
+    AUDIT_FLUSH_INTERVAL = 0.05  # segundos
+    
+    # Tabela própria: audit_log já existe com outro formato (AuditLogger)
+    AUDIT_LOG_DDL = (
+        """
+        CREATE TABLE IF NOT EXISTS lead_audit_log (
+            id BIGSERIAL PRIMARY KEY,
+            event TEXT NOT NULL,
+            source TEXT NOT NULL,
+            lead_id BIGINT,
+            ts TIMESTAMP NOT NULL,
+            data JSONB
+        )
+        """,
+    )
+    
     def __init__(self, db_connection=None):
         """
         Inicializa serviço
@@ -18,6 +105,14 @@ class LeadService:
             db_connection: Conexão com banco de dados
         """
         self.db = db_connection
+        self._insert_buf = []
+        self._flush_handle = None
+        self._flush_tasks = set()
+        self._audit_ring = collections.deque(maxlen=self.AUDIT_RING_SIZE)
+        self._audit_dropped = 0
+        self._audit_task = None
+        self._audit_wakeup = None
+        self._schema_ready = False
     
     async def create_from_ai_qualification(self, crm_data: Dict) -> Dict:
         """
@@ -37,8 +132,8 @@ class LeadService:
                 'status': crm_data.get('status', 'new'),
                 'source': crm_data.get('source', 'ai_qualification'),
                 'priority': crm_data.get('priority', 'medium'),
-                'tags': json.dumps(crm_data.get('tags', [])),
-                'custom_fields': json.dumps(crm_data.get('custom_fields', {})),
+                'tags': orjson.dumps(crm_data.get('tags', [])).decode(),
+                'custom_fields': orjson.dumps(crm_data.get('custom_fields', {})).decode(),
                 'notes': crm_data.get('notes', ''),
                 'qualification_score': crm_data.get('qualification_score', 0),
                 'qualified_at': crm_data.get('qualified_at', datetime.now().isoformat()),
@@ -55,11 +150,9 @@ class LeadService:
             
             lead_data['id'] = lead_id
             
-            # Notifica atendente atribuído
-            await self._notify_assigned_agent(lead_data)
-            
-            # Log de auditoria
-            await self._log_lead_creation(lead_data)
+            # Notifica atendente atribuído e registra auditoria em segundo plano
+            _enqueue_side_effect(self._notify_assigned_agent, lead_data)
+            self._log_lead_creation(lead_data)
             
             return lead_data
             
@@ -67,23 +160,79 @@ class LeadService:
             raise Exception(f"Erro ao criar lead: {str(e)}")
     
     async def _insert_lead(self, lead_data: Dict) -> str:
-        """Insere lead no banco de dados"""
-        # Implementação real de insert no BD
-        # Este é um exemplo simplificado
-        query = """
-            INSERT INTO leads (
-                phone, name, status, source, priority, 
-                tags, custom_fields, notes, qualification_score,
-                qualified_at, created_at, assigned_to
-            ) VALUES (
-                %(phone)s, %(name)s, %(status)s, %(source)s, %(priority)s,
-                %(tags)s, %(custom_fields)s, %(notes)s, %(qualification_score)s,
-                %(qualified_at)s, %(created_at)s, %(assigned_to)s
-            ) RETURNING id
         """
+        Insere lead no banco de dados
+        
+        Os INSERTs são agrupados: o lead entra no buffer e a chamada
+        aguarda o flush, que acontece ao juntar INSERT_BATCH_SIZE leads
+        ou após INSERT_BATCH_DELAY segundos, o que vier primeiro.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._insert_buf.append((lead_data, future))
+        
+        if len(self._insert_buf) >= self.INSERT_BATCH_SIZE:
+            self._flush_inserts()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.INSERT_BATCH_DELAY, self._flush_inserts)
+        
+        return await future
+    
+    def _flush_inserts(self):
+        """Dispara a gravação do lote acumulado"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
         
-        result = await self.db.execute(query, lead_data)
-        return result['id']
+        batch, self._insert_buf = self._insert_buf, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._write_batch(batch))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+    
+    async def _write_batch(self, batch: List[tuple]):
+        """
+        Grava um lote de leads com um único INSERT multi-linhas
+        
+        RETURNING não garante a ordem do VALUES, então cada id volta para
+        quem esperava pelo telefone. Toda future ainda pendente no fim
+        (erro, linha faltando) recebe uma exceção: ninguém fica esperando
+        para sempre.
+        """
+        error = None
+        try:
+            values = []
+            params = {}
+            for i, (lead_data, _) in enumerate(batch):
+                values.append('(' + ', '.join(f'%({col}_{i})s' for col in self.LEAD_COLUMNS) + ')')
+                for col in self.LEAD_COLUMNS:
+                    params[f'{col}_{i}'] = lead_data[col]
+            
+            query = f"""
+                INSERT INTO leads ({', '.join(self.LEAD_COLUMNS)})
+                VALUES {', '.join(values)}
+                RETURNING id, phone
+            """
+            
+            rows = await self.db.fetch_all(query, params)
+            
+            # Telefone -> futures na ordem do lote (telefone repetido no lote
+            # recebe os ids na ordem em que voltarem)
+            waiting = collections.defaultdict(collections.deque)
+            for lead_data, future in batch:
+                waiting[lead_data['phone']].append(future)
+            for row in rows:
+                futures = waiting.get(row['phone'])
+                if futures:
+                    future = futures.popleft()
+                    if not future.done():
+                        future.set_result(row['id'])
+        except Exception as e:
+            error = e
+        finally:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error or Exception("Lead não retornado pelo INSERT em lote"))
     
     def _get_next_available_agent(self) -> Optional[str]:
         """
@@ -115,19 +264,73 @@ class LeadService:
             # await notification_service.send(notification)
             pass
     
-    async def _log_lead_creation(self, lead_data: Dict):
-        """Registra criação de lead para auditoria"""
-        log_entry = {
-            'event': 'lead_created',
-            'source': 'ai_qualification',
-            'lead_id': lead_data['id'],
-            'timestamp': datetime.now().isoformat(),
-            'data': lead_data
-        }
+    def _log_lead_creation(self, lead_data: Dict):
+        """
+        Registra criação de lead para auditoria
         
-        # Salvar em sistema de logs (implementar conforme infraestrutura)
-        # await audit_service.log(log_entry)
-        pass
+        Só empilha o registro no buffer circular e acorda a task
+        _audit_flusher, que grava em lotes. Com o buffer cheio o registro
+        mais antigo é descartado e contado em `_audit_dropped`.
+        """
+        if not self.db:
+            return
+        
+        if len(self._audit_ring) == self._audit_ring.maxlen:
+            self._audit_dropped += 1
+        self._audit_ring.append((time.time(), lead_data['id'], lead_data))
+        
+        loop = asyncio.get_running_loop()
+        if self._audit_task is None or self._audit_task.done() or self._audit_task.get_loop() is not loop:
+            self._audit_wakeup = asyncio.Event()
+            self._audit_task = loop.create_task(self._audit_flusher(self._audit_wakeup))
+        self._audit_wakeup.set()
+    
+    async def _audit_flusher(self, wakeup: asyncio.Event):
+        """
+        Esvazia o buffer de auditoria em lotes de AUDIT_BATCH_SIZE
+        
+        Fica bloqueada em `wakeup` enquanto não há registros; ao acordar,
+        espera AUDIT_FLUSH_INTERVAL para juntar a rajada no mesmo lote.
+        """
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+            await asyncio.sleep(self.AUDIT_FLUSH_INTERVAL)
+            
+            while self._audit_ring:
+                batch = []
+                while self._audit_ring and len(batch) < self.AUDIT_BATCH_SIZE:
+                    batch.append(self._audit_ring.popleft())
+                
+                try:
+                    await self._write_audit_batch(batch)
+                except Exception as e:
+                    logger.warning("⚠️ Erro ao gravar %d registros de auditoria: %s", len(batch), e)
+    
+    async def _write_audit_batch(self, batch: List[tuple]):
+        """Grava um lote de registros de auditoria com um único INSERT"""
+        await self.ensure_schema()
+        
+        values = []
+        params = {'event': 'lead_created', 'source': 'ai_qualification'}
+        for i, (ts, lead_id, lead_data) in enumerate(batch):
+            values.append(f'(%(event)s, %(source)s, %(lead_id_{i})s, %(ts_{i})s, %(data_{i})s)')
+            params[f'lead_id_{i}'] = lead_id
+            params[f'ts_{i}'] = datetime.fromtimestamp(ts).isoformat()
+            params[f'data_{i}'] = orjson.dumps(lead_data, default=str).decode()
+        
+        query = f"""
+            INSERT INTO lead_audit_log (event, source, lead_id, ts, data)
+            VALUES {', '.join(values)}
+        """
+        await self.db.execute(query, params)
+    
+    def get_audit_stats(self) -> Dict:
+        """Retorna o estado do buffer de auditoria"""
+        return {
+            'pending': len(self._audit_ring),
+            'dropped': self._audit_dropped
+        }
     
     async def get_ai_qualified_leads(
         self,
@@ -206,6 +409,47 @@ class LeadService:
             )
         }
     
+    async def ensure_schema(self):
+        """
+        Cria as tabelas auxiliares do serviço (lead_notes e lead_audit_log),
+        se necessário
+        
+        O construtor é síncrono e não pode esperar o banco, então a criação
+        acontece uma vez, na primeira operação que usa essas tabelas.
+        """
+        if self._schema_ready or not self.db:
+            return
+        
+        for ddl in self.LEAD_NOTES_DDL + self.AUDIT_LOG_DDL:
+            await self.db.execute(ddl, {})
+        self._schema_ready = True
+    
+    async def get_lead_notes(self, lead_id: str, limit: int = 50) -> List[Dict]:
+        """
+        Obtém as notas de um lead (histórico de lead_notes)
+        
+        Args:
+            lead_id: ID do lead
+            limit: Quantidade de notas
+            
+        Returns:
+            Notas da mais recente para a mais antiga
+        """
+        if not self.db:
+            return []
+        
+        await self.ensure_schema()
+        
+        query = """
+            SELECT ts, note FROM lead_notes
+            WHERE lead_id = %(lead_id)s
+            ORDER BY ts DESC
+            LIMIT %(limit)s
+        """
+        
+        results = await self.db.fetch_all(query, {'lead_id': lead_id, 'limit': limit})
+        return [dict(row) for row in results]
+    
     async def update_lead_status(
         self,
         lead_id: str,
@@ -227,13 +471,21 @@ class LeadService:
             'updated_at': datetime.now().isoformat()
         }
         
-        if notes:
-            query += ", notes = CONCAT(notes, %(notes)s)"
-            params['notes'] = f"\n\n[{datetime.now().isoformat()}] {notes}"
-        
         query += " WHERE id = %(lead_id)s"
         params['lead_id'] = lead_id
         
+        if notes:
+            await self.ensure_schema()
+            
+            # Nota vai para lead_notes (append-only) em vez de reescrever
+            # a coluna TEXT inteira; um único statement mantém a atomicidade
+            query = f"""
+                WITH updated AS ({query} RETURNING id)
+                INSERT INTO lead_notes (lead_id, ts, note)
+                SELECT id, %(updated_at)s, %(notes)s FROM updated
+            """
+            params['notes'] = notes
+        
         await self.db.execute(query, params)
         return True
     
@@ -0,0 +1,111 @@
+"""
+Ajustes de transporte do Socket.IO
+Reduz a latência de entrega das notificações em tempo real
+"""
+
+import socket
+import logging
+import msgpack
+import orjson
+from socketio import RedisManager
+from werkzeug.serving import WSGIRequestHandler
+
+try:
+    from redis.exceptions import RedisError
+except ImportError:  # redis é opcional (só com SOCKETIO_MESSAGE_QUEUE)
+    RedisError = OSError
+
+logger = logging.getLogger(__name__)
+
+
+class LowLatencyRequestHandler(WSGIRequestHandler):
+    """
+    Request handler do servidor Werkzeug (async_mode="threading") com
+    opções de socket ajustadas para mensagens pequenas e frequentes:
+
+    - TCP_NODELAY: desativa o algoritmo de Nagle, que segura frames
+      pequenos do WebSocket por até ~40ms esperando mais dados
+    - SO_SNDBUF de 256KB: rajadas de notificações cabem no buffer do
+      kernel sem bloquear a thread que faz o emit
+    """
+
+    # StreamRequestHandler aplica TCP_NODELAY no setup() quando True
+    disable_nagle_algorithm = True
+
+    SEND_BUFFER_SIZE = 256 * 1024
+
+    def setup(self):
+        super().setup()
+        try:
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.SEND_BUFFER_SIZE)
+        except OSError:
+            # Alguns sistemas limitam o tamanho do buffer; segue com o padrão
+            pass
+
+
+class OrjsonJSON:
+    """
+    Módulo JSON compatível com o que o python-socketio/python-engineio
+    esperam (dumps/loads), implementado com orjson
+
+    Os pacotes chamam dumps(data, separators=...); orjson já gera a
+    saída compacta, então os argumentos extras são ignorados.
+    """
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    @staticmethod
+    def loads(data, **kwargs):
+        return orjson.loads(data)
+
+
+class MsgpackRedisManager(RedisManager):
+    """
+    Client manager do Socket.IO sobre Redis que serializa as mensagens
+    entre workers com msgpack em vez de pickle
+
+    Só o tráfego interno (worker -> Redis -> worker) muda: cada worker
+    decodifica a mensagem e reenvia aos seus clientes em JSON. Mensagens
+    que não são msgpack (ex: publicadas por um worker antigo) seguem para
+    o tratamento padrão do python-socketio.
+
+    msgpack não distingue tupla de lista, e o python-socketio usa tupla em
+    "data" para um emit com vários argumentos (lista = um argumento só).
+    Por isso o tipo de "data" viaja marcado em DATA_IS_TUPLE.
+    """
+
+    DATA_IS_TUPLE = "_data_is_tuple"
+
+    def _publish(self, data):
+        if isinstance(data, dict) and isinstance(data.get("data"), tuple):
+            data = dict(data, **{self.DATA_IS_TUPLE: True})
+        packed = msgpack.packb(data, use_bin_type=True, default=str)
+        retry = True
+        while True:
+            try:
+                if not retry:
+                    self._redis_connect()
+                return self.redis.publish(self.channel, packed)
+            except RedisError:
+                if retry:
+                    logger.error("⚠️ Falha ao publicar no Redis, tentando novamente")
+                    retry = False
+                else:
+                    logger.error("❌ Falha ao publicar no Redis, mensagem descartada")
+                    break
+
+    def _listen(self):
+        for message in super()._listen():
+            if isinstance(message, bytes):
+                try:
+                    data = msgpack.unpackb(message, raw=False)
+                except Exception:
+                    data = None
+                if isinstance(data, dict):
+                    if data.pop(self.DATA_IS_TUPLE, False):
+                        data["data"] = tuple(data["data"])
+                    yield data
+                    continue
+            yield message
@@ -0,0 +1,70 @@
+"""
+Busca de mensagens: o índice FTS5 deve trazer os mesmos resultados que
+LIKE '%termo%'
+"""
+import pytest
+
+from database import Database
+from utils import MessageSearcher
+
+MESSAGES = [
+    "Olá, mundo!",
+    "Bem-vindo ao submundo",
+    "Meu email é joao@exemplo.com",
+    "Promoção!!! Só hoje",
+    'Ele disse "sim"',
+    "Desconto de 10*2 reais",
+    "MUNDIAL de futebol",
+    "ok",
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / "crm.db"))
+    with database.pool.connection() as conn:
+        lead_id = conn.execute(
+            "INSERT INTO leads (name, phone) VALUES ('Lead', '5511999999999')"
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO messages (lead_id, sender_type, sender_name, content) VALUES (?, 'lead', 'Lead', ?)",
+            [(lead_id, content) for content in MESSAGES]
+        )
+        conn.commit()
+    return database
+
+
+def _search_ids(database, term, use_fts):
+    database.fts_enabled = use_fts
+    result = MessageSearcher(database).search_messages(search_term=term, limit=100)
+    return sorted(m["id"] for m in result["messages"])
+
+
+@pytest.mark.parametrize("term", [
+    "@", "!!!", '"', "*",          # só pontuação
+    "mundo", "undo", "bmun",       # pedaço de palavra
+    "MUNDO", "ok", "o", "10*2",
+    "joao@exemplo", 'disse "sim"',
+])
+def test_fts_matches_like(db, term):
+    assert db.fts_enabled
+    expected = _search_ids(db, term, use_fts=False)
+    assert _search_ids(db, term, use_fts=True) == expected
+
+
+def test_mid_word_term_finds_substring(db):
+    contents = [m["content"] for m in MessageSearcher(db).search_messages(search_term="mundo")["messages"]]
+    assert "Bem-vindo ao submundo" in contents
+
+
+def test_pages_are_disjoint_with_equal_timestamps(db):
+    # Todas as mensagens do fixture têm o mesmo timestamp: só o desempate
+    # por id no ORDER BY externo garante páginas sem repetição
+    searcher = MessageSearcher(db)
+    seen = []
+    for offset in range(0, len(MESSAGES), 3):
+        page = searcher.search_messages(limit=3, offset=offset)
+        assert page["total"] == len(MESSAGES)
+        seen.extend(m["id"] for m in page["messages"])
+    assert len(seen) == len(set(seen)) == len(MESSAGES)
+    assert seen == sorted(seen, reverse=True)
@@ -0,0 +1,52 @@
+"""
+MsgpackRedisManager: mensagens entre workers devem chegar como foram
+publicadas (inclusive emits com vários argumentos)
+"""
+from unittest import mock
+
+from socketio import RedisManager
+
+from socketio_tuning import MsgpackRedisManager
+
+
+class FakeRedis:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append(message)
+        return 1
+
+
+def _round_trip(message):
+    manager = MsgpackRedisManager.__new__(MsgpackRedisManager)
+    manager.redis = FakeRedis()
+    manager.channel = "socketio"
+    manager._publish(message)
+    with mock.patch.object(RedisManager, "_listen", return_value=iter(manager.redis.published)):
+        return list(manager._listen())
+
+
+def _emit(data):
+    return {"method": "emit", "event": "new_messages", "data": data,
+            "namespace": "/", "room": None, "skip_sid": None,
+            "callback": None, "host_id": "abc"}
+
+
+def test_multi_argument_emit_keeps_tuple():
+    [received] = _round_trip(_emit(("lead", {"id": 1}, 3)))
+    assert received == _emit(("lead", {"id": 1}, 3))
+    assert isinstance(received["data"], tuple)
+
+
+def test_single_list_argument_stays_list():
+    events = [{"id": 1}, {"id": 2}]
+    [received] = _round_trip(_emit(events))
+    assert received == _emit(events)
+    assert isinstance(received["data"], list)
+
+
+def test_non_msgpack_message_passes_through():
+    manager = MsgpackRedisManager.__new__(MsgpackRedisManager)
+    with mock.patch.object(RedisManager, "_listen", return_value=iter([b"\x80\x04legacy"])):
+        assert list(manager._listen()) == [b"\x80\x04legacy"]
@@ -1,14 +1,201 @@
 """
 Utilidades para paginação, busca e performance
 """
-import sqlite3
-from typing import List, Dict, Any, Optional
-from datetime import datetime, timedelta
+import heapq
+from collections import OrderedDict, deque
+from functools import lru_cache
+from time import monotonic
+from typing import List, Dict, Any, Iterator, Literal, Optional, Tuple
+from datetime import datetime
+
+
+def _content_filter(database, search_term: str, column: str = "content") -> Tuple[str, str]:
+    """
+    Monta o filtro de busca no conteúdo das mensagens
+    
+    Com o índice trigram (messages_fts) o termo vira uma frase, o que
+    equivale a LIKE '%termo%' (substring, sem diferenciar maiúsculas).
+    Termos com menos de 3 caracteres (o trigram não os indexa), com
+    curingas do LIKE (% ou _) ou sem FTS5 continuam com LIKE '%termo%'.
+    
+    Returns:
+        (trecho SQL com um placeholder, parâmetro)
+    """
+    if (getattr(database, 'fts_enabled', False) and len(search_term) >= 3
+            and '%' not in search_term and '_' not in search_term):
+        phrase = '"' + search_term.replace('"', '""') + '"'
+        return "id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)", phrase
+    
+    return f"{column} LIKE ?", f"%{search_term}%"
+
+
+# Caracteres especiais de LIKE/GLOB: com eles a busca por prefixo cai no modo "contains"
+_PREFIX_UNSAFE = frozenset('%_*?[')
+
+# Ordem das mensagens na busca (id desempata timestamps iguais entre páginas)
+_MESSAGE_ORDER = "timestamp DESC, id DESC"
+
+_LEAD_SORT_FIELDS = ('id', 'name', 'phone', 'status', 'created_at', 'updated_at', 'last_message_at')
+
+
+@lru_cache(maxsize=64)
+def _build_message_search_sql(
+    has_lead_id: bool,
+    content_sql: Optional[str],
+    has_sender: bool,
+    has_date_from: bool,
+    has_date_to: bool
+) -> Tuple[str, str]:
+    """
+    Monta o SQL de MessageSearcher.search_messages para uma combinação de filtros
+    
+    Só depende de quais filtros estão ativos (os valores vão como
+    parâmetros), então o texto é montado uma vez por combinação e o mesmo
+    string volta sempre, aproveitando o cache de statements do sqlite3.
+    
+    Returns:
+        (query base sem ORDER BY, para _fetch_page; query ordenada, sem paginação)
+    """
+    where = "WHERE 1=1"
+    if has_lead_id:
+        where += " AND lead_id = ?"
+    if content_sql:
+        where += f" AND {content_sql}"
+    if has_sender:
+        where += " AND sender_type = ?"
+    if has_date_from:
+        where += " AND timestamp >= ?"
+    if has_date_to:
+        where += " AND timestamp <= ?"
+    
+    base_query = f"SELECT * FROM messages {where}"
+    # Sem janela: COUNT(*) OVER () obrigaria o SQLite a ler tudo antes da 1ª linha
+    stream_query = f"{base_query} ORDER BY {_MESSAGE_ORDER}"
+    return base_query, stream_query
+
+
+@lru_cache(maxsize=64)
+def _build_lead_search_sql(
+    term_sql: Optional[str],
+    has_status: bool,
+    assigned_mode: Optional[str],
+    has_city: bool,
+    has_origin: bool,
+    has_date_from: bool,
+    has_date_to: bool,
+    sort_by: str,
+    sort_order: str,
+    include_message_count: bool
+) -> Tuple[str, str]:
+    """
+    Monta o SQL de LeadSearcher.search_leads para uma combinação de filtros
+    
+    Args:
+        assigned_mode: None, 'unassigned' (IS NULL) ou 'user' (= ?)
+        sort_by/sort_order: já validados por quem chama
+        include_message_count: Faz o JOIN com messages + GROUP BY para
+            calcular messages_count; sem ele a query é uma linha por lead
+    
+    Returns:
+        (query da página com _total_rows, query de COUNT)
+    """
+    where = "WHERE 1=1"
+    if term_sql:
+        where += f" AND {term_sql}"
+    if has_status:
+        where += " AND l.status = ?"
+    if assigned_mode == 'unassigned':
+        where += " AND l.assigned_to IS NULL"
+    elif assigned_mode == 'user':
+        where += " AND l.assigned_to = ?"
+    if has_city:
+        where += " AND l.city LIKE ?"
+    if has_origin:
+        where += " AND l.origin LIKE ?"
+    if has_date_from:
+        where += " AND l.created_at >= ?"
+    if has_date_to:
+        where += " AND l.created_at <= ?"
+    
+    if include_message_count:
+        base = f"""
+            FROM leads l
+            LEFT JOIN users u ON l.assigned_to = u.id
+            LEFT JOIN messages m ON l.id = m.lead_id
+            {where}
+            GROUP BY l.id
+        """
+        columns = "l.*, u.name as vendedor_name,\n                   COUNT(DISTINCT m.id) as messages_count"
+    else:
+        # users.id é PK: o LEFT JOIN não multiplica linhas, dispensa GROUP BY
+        base = f"""
+            FROM leads l
+            LEFT JOIN users u ON l.assigned_to = u.id
+            {where}
+        """
+        columns = "l.*, u.name as vendedor_name"
+    
+    # Total vem junto da página; com GROUP BY a janela é aplicada depois
+    # do agrupamento, então conta leads e não mensagens
+    page_query = f"""
+            SELECT {columns},
+                   COUNT(*) OVER () AS _total_rows
+            {base}
+            ORDER BY l.{sort_by} {sort_order}
+            LIMIT ? OFFSET ?
+    """
+    count_query = f"SELECT COUNT(*) FROM (SELECT l.id {base})"
+    return page_query, count_query
+
+
+def _pop_total(rows: List[Dict[str, Any]], cursor, count_query: str, params: List[Any], offset: int) -> int:
+    """
+    Extrai o total da coluna `_total_rows` (COUNT(*) OVER ()) das linhas
+    
+    Se a página veio vazia com offset > 0, a janela não diz quantos itens
+    existem; só nesse caso o COUNT separado é executado.
+    """
+    if rows:
+        total = rows[0]['_total_rows']
+        for row in rows:
+            del row['_total_rows']
+        return total
+    
+    if offset <= 0:
+        return 0
+    
+    cursor.execute(count_query, params)
+    return cursor.fetchone()[0]
+
+
+def _fetch_page(cursor, base_query: str, order_by: str, params: List[Any],
+                limit: int, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Lê uma página de `base_query` com o total na mesma query (COUNT(*) OVER ())
+    
+    O ORDER BY vai na query externa: a ordem de uma subquery não é
+    garantida no SELECT de fora (ainda menos com função de janela), e sem
+    ela páginas poderiam repetir ou pular linhas.
+    
+    Returns:
+        (linhas da página como dicts, total)
+    """
+    params = list(params)
+    cursor.execute(
+        f"SELECT *, COUNT(*) OVER () AS _total_rows FROM ({base_query}) ORDER BY {order_by} LIMIT ? OFFSET ?",
+        params + [limit, offset]
+    )
+    rows = [dict(row) for row in cursor.fetchall()]
+    total = _pop_total(rows, cursor, f"SELECT COUNT(*) FROM ({base_query})", params, offset)
+    return rows, total
 
 
 class Paginator:
     """
     Classe para paginar resultados
+    
+    O construtor recebe a lista completa já materializada. Para resultados
+    vindos do banco, prefira Paginator.from_query, que busca só a página.
     """
     def __init__(self, items: List[Any], page: int = 1, per_page: int = 20):
         self.items = items
@@ -16,12 +203,41 @@ class Paginator:
         self.per_page = min(100, max(1, per_page))  # Limite de 100 itens por página
         self.total = len(items)
         self.pages = (self.total + self.per_page - 1) // self.per_page or 1
+        
+        # Fatia da página calculada uma vez (get_page_items/to_dict reaproveitam)
+        start = (self.page - 1) * self.per_page
+        self._page_items = items[start:start + self.per_page]
+    
+    @classmethod
+    def from_query(cls, cursor, base_query: str, order_by: str, params: List[Any] = (),
+                   page: int = 1, per_page: int = 20) -> 'Paginator':
+        """
+        Pagina no SQL (LIMIT/OFFSET) em vez de fatiar a lista em Python
+        
+        Só as linhas da página são lidas; o total vem na mesma query via
+        COUNT(*) OVER () (ver _fetch_page, usada também por
+        MessageSearcher.search_messages).
+        
+        Args:
+            cursor: Cursor SQLite (row_factory=sqlite3.Row)
+            base_query: SELECT completo, sem ORDER BY/LIMIT/OFFSET
+            order_by: Ordenação (ex: "timestamp DESC, id DESC"), aplicada por fora
+            params: Parâmetros da query
+            page: Página (a partir de 1)
+            per_page: Itens por página
+        """
+        paginator = cls([], page, per_page)
+        offset = (paginator.page - 1) * paginator.per_page
+        paginator.items, paginator.total = _fetch_page(
+            cursor, base_query, order_by, params, paginator.per_page, offset
+        )
+        paginator.pages = (paginator.total + paginator.per_page - 1) // paginator.per_page or 1
+        paginator._page_items = paginator.items
+        return paginator
     
     def get_page_items(self) -> List[Any]:
         """Retorna itens da página atual"""
-        start = (self.page - 1) * self.per_page
-        end = start + self.per_page
-        return self.items[start:end]
+        return self._page_items
     
     def to_dict(self) -> Dict[str, Any]:
         """Converte para dicionário com metadados"""
@@ -45,6 +261,40 @@ class MessageSearcher:
     def __init__(self, database):
         self.db = database
     
+    def _message_search_sql(
+        self,
+        lead_id: Optional[int],
+        search_term: Optional[str],
+        sender_type: Optional[str],
+        date_from: Optional[datetime],
+        date_to: Optional[datetime]
+) -> Tuple[Tuple[str, str], List[Any]]:
+        """Resolve os filtros de busca de mensagens em (SQLs, parâmetros)"""
+        params = []
+        content_sql = None
+        
+        # Filtros (a ordem dos parâmetros segue a ordem do SQL montado)
+        if lead_id:
+            params.append(lead_id)
+        
+        if search_term:
+            content_sql, content_param = _content_filter(self.db, search_term)
+            params.append(content_param)
+        
+        if sender_type:
+            params.append(sender_type)
+        
+        if date_from:
+            params.append(date_from.isoformat())
+        
+        if date_to:
+            params.append(date_to.isoformat())
+        
+        sql = _build_message_search_sql(
+            bool(lead_id), content_sql, bool(sender_type), bool(date_from), bool(date_to)
+        )
+        return sql, params
+    
     def search_messages(
         self,
         lead_id: Optional[int] = None,
@@ -70,48 +320,12 @@ class MessageSearcher:
         Returns:
             Dict com mensagens e total de resultados
         """
-        conn = sqlite3.connect(self.db.db_name)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Construir query
-        query = "SELECT * FROM messages WHERE 1=1"
-        params = []
-        
-        # Filtros
-        if lead_id:
-            query += " AND lead_id = ?"
-            params.append(lead_id)
-        
-        if search_term:
-            query += " AND content LIKE ?"
-            params.append(f"%{search_term}%")
-        
-        if sender_type:
-            query += " AND sender_type = ?"
-            params.append(sender_type)
+        (base_query, _), params = self._message_search_sql(
+            lead_id, search_term, sender_type, date_from, date_to
+        )
         
-        if date_from:
-            query += " AND timestamp >= ?"
-            params.append(date_from.isoformat())
-        
-        if date_to:
-            query += " AND timestamp <= ?"
-            params.append(date_to.isoformat())
-        
-        # Count total
-        count_query = query.replace("SELECT *", "SELECT COUNT(*)")
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()[0]
-        
-        # Buscar com paginação
-        query += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
-        
-        cursor.execute(query, params)
-        messages = [dict(row) for row in cursor.fetchall()]
-        
-        conn.close()
+        with self.db.pool.connection() as conn:
+            messages, total = _fetch_page(conn.cursor(), base_query, _MESSAGE_ORDER, params, limit, offset)
         
         return {
             "messages": messages,
@@ -120,44 +334,118 @@ class MessageSearcher:
             "offset": offset
         }
     
+    def iter_search_messages(
+        self,
+        lead_id: Optional[int] = None,
+        search_term: Optional[str] = None,
+        sender_type: Optional[str] = None,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Versão em streaming de search_messages (mesmos filtros, sem total)
+        
+        As mensagens são lidas do cursor conforme o consumidor avança, sem
+        montar a lista inteira. A conexão do pool fica emprestada até o
+        gerador terminar ou ser fechado.
+        """
+        (_, stream_query), params = self._message_search_sql(
+            lead_id, search_term, sender_type, date_from, date_to
+        )
+        
+        with self.db.pool.connection() as conn:
+            for row in conn.execute(stream_query, params):
+                yield dict(row)
+    
     def search_in_lead(self, lead_id: int, search_term: str) -> List[Dict[str, Any]]:
         """
         Busca mensagens em um lead específico
         Retorna com contexto (mensagens antes e depois)
         """
-        conn = sqlite3.connect(self.db.db_name)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Buscar mensagens que correspondem ao termo
-        cursor.execute("""
-            SELECT id, content, timestamp, sender_type, sender_name
-            FROM messages
-            WHERE lead_id = ? AND content LIKE ?
-            ORDER BY timestamp DESC
-            LIMIT 10
-        """, (lead_id, f"%{search_term}%"))
-        
-        results = []
-        for row in cursor.fetchall():
-            message_id = row['id']
-            
-            # Buscar contexto (2 mensagens antes e 2 depois)
-            cursor.execute("""
-                SELECT * FROM messages
-                WHERE lead_id = ?
-                AND id BETWEEN ? AND ?
-                ORDER BY id ASC
-            """, (lead_id, message_id - 2, message_id + 2))
+        content_sql, content_param = _content_filter(self.db, search_term)
+        
+        with self.db.pool.connection() as conn:
+            cursor = conn.cursor()
             
-            context = [dict(r) for r in cursor.fetchall()]
+            # Correspondências + contexto (2 mensagens antes e 2 depois)
+            # em uma única query, em vez de uma query de contexto por match
+            cursor.execute(f"""
+                WITH matches AS (
+                    SELECT id, content, timestamp, sender_type, sender_name
+                    FROM messages
+                    WHERE lead_id = ? AND {content_sql}
+                    ORDER BY timestamp DESC
+                    LIMIT 10
+                )
+                SELECT m.*,
+                       ma.id AS _match_id, ma.content AS _match_content,
+                       ma.timestamp AS _match_timestamp, ma.sender_type AS _match_sender_type,
+                       ma.sender_name AS _match_sender_name
+                FROM matches ma
+                JOIN messages m ON m.lead_id = ? AND m.id BETWEEN ma.id - 2 AND ma.id + 2
+                ORDER BY ma.timestamp DESC, ma.id DESC, m.id ASC
+            """, (lead_id, content_param, lead_id))
             
-            results.append({
-                "match": dict(row),
-                "context": context
-            })
+            results = []
+            current_id = None
+            for row in cursor.fetchall():
+                row = dict(row)
+                match = {
+                    "id": row.pop('_match_id'),
+                    "content": row.pop('_match_content'),
+                    "timestamp": row.pop('_match_timestamp'),
+                    "sender_type": row.pop('_match_sender_type'),
+                    "sender_name": row.pop('_match_sender_name')
+                }
+                if match["id"] != current_id:
+                    current_id = match["id"]
+                    results.append({"match": match, "context": []})
+                results[-1]["context"].append(row)
+        
+        return results
+    
+    def search_in_lead_many(self, lead_id: int, terms: List[str], limit: int = 10) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Busca vários termos em um lead com uma única query
+        
+        Cada termo vira um SELECT (com o mesmo filtro de search_in_lead)
+        unido por UNION ALL, então N termos custam uma ida ao banco.
+        
+        Args:
+            lead_id: ID do lead
+            terms: Termos de busca (duplicados são ignorados)
+            limit: Máximo de mensagens por termo
+        
+        Returns:
+            Dict {termo: [mensagens]}, mais recentes primeiro
+        """
+        terms = list(dict.fromkeys(t for t in terms if t))
+        results = {term: [] for term in terms}
+        if not terms:
+            return results
+        
+        selects = []
+        params = []
+        for term in terms:
+            content_sql, content_param = _content_filter(self.db, term)
+            selects.append(f"""
+                SELECT * FROM (
+                    SELECT ? AS _term, id, content, timestamp, sender_type, sender_name
+                    FROM messages
+                    WHERE lead_id = ? AND {content_sql}
+                    ORDER BY timestamp DESC
+                    LIMIT ?
+                )
+            """)
+            params.extend([term, lead_id, content_param, limit])
+        
+        with self.db.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(" UNION ALL ".join(selects), params)
+            for row in cursor.fetchall():
+                row = dict(row)
+                results[row.pop('_term')].append(row)
         
-        conn.close()
         return results
 
 
@@ -180,7 +468,9 @@ class LeadSearcher:
         sort_by: str = "updated_at",
         sort_order: str = "DESC",
         limit: int = 50,
-        offset: int = 0
+        offset: int = 0,
+        include_message_count: bool = False,
+        search_mode: Literal["contains", "prefix"] = "contains"
     ) -> Dict[str, Any]:
         """
         Busca leads com filtros avançados
@@ -197,81 +487,73 @@ class LeadSearcher:
             sort_order: ASC ou DESC
             limit: Quantidade máxima de resultados
             offset: Offset para paginação
+            include_message_count: Inclui messages_count em cada lead
+                (exige JOIN com messages, que é a parte cara da query)
+            search_mode: "contains" (termo em qualquer posição) ou "prefix"
+                (nome/telefone começando com o termo, resolvido por índice)
         
         Returns:
             Dict com leads e total de resultados
         """
-        conn = sqlite3.connect(self.db.db_name)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        # Construir query
-        query = """
-            SELECT l.*, u.name as vendedor_name,
-                   COUNT(DISTINCT m.id) as messages_count
-            FROM leads l
-            LEFT JOIN users u ON l.assigned_to = u.id
-            LEFT JOIN messages m ON l.id = m.lead_id
-            WHERE 1=1
-        """
         params = []
+        term_sql = None
+        assigned_mode = None
         
-        # Filtros
+        # Filtros (a ordem dos parâmetros segue a ordem do SQL montado)
         if search_term:
-            query += " AND (l.name LIKE ? OR l.phone LIKE ? OR l.email LIKE ?)"
-            search_pattern = f"%{search_term}%"
-            params.extend([search_pattern, search_pattern, search_pattern])
+            term = search_term.strip()
+            if search_mode == "prefix" and term and not _PREFIX_UNSAFE.intersection(term):
+                # Começa com: LIKE 'x%' (NOCASE) e GLOB 'x*' usam os índices
+                # de name e phone, em vez de varrer a tabela
+                term_sql = "(l.name LIKE ? OR l.phone GLOB ?)"
+                params.extend([f"{term}%", f"{term}*"])
+            # Trigram exige ao menos 3 caracteres; curingas do LIKE ficam no LIKE
+            elif getattr(self.db, 'leads_fts_enabled', False) and len(term) >= 3 and '%' not in term and '_' not in term:
+                term_sql = "l.id IN (SELECT rowid FROM leads_fts WHERE leads_fts MATCH ?)"
+                params.append('"' + term.replace('"', '""') + '"')
+            else:
+                columns = getattr(self.db, 'lead_search_columns', ('name', 'phone', 'email'))
+                term_sql = "(" + " OR ".join(f"l.{col} LIKE ?" for col in columns) + ")"
+                params.extend([f"%{search_term}%"] * len(columns))
         
         if status:
-            query += " AND l.status = ?"
             params.append(status)
         
         if assigned_to is not None:
             if assigned_to == -1:  # Não atribuídos
-                query += " AND l.assigned_to IS NULL"
+                assigned_mode = 'unassigned'
             else:
-                query += " AND l.assigned_to = ?"
+                assigned_mode = 'user'
                 params.append(assigned_to)
         
         if city:
-            query += " AND l.city LIKE ?"
             params.append(f"%{city}%")
         
         if origin:
-            query += " AND l.origin LIKE ?"
             params.append(f"%{origin}%")
         
         if date_from:
-            query += " AND l.created_at >= ?"
             params.append(date_from.isoformat())
         
         if date_to:
-            query += " AND l.created_at <= ?"
             params.append(date_to.isoformat())
         
-        query += " GROUP BY l.id"
-        
-        # Count total
-        count_query = f"SELECT COUNT(*) FROM ({query})"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()[0]
-        
         # Ordenação
-        valid_sort_fields = ['id', 'name', 'phone', 'status', 'created_at', 'updated_at', 'last_message_at']
-        if sort_by not in valid_sort_fields:
+        if sort_by not in _LEAD_SORT_FIELDS:
             sort_by = 'updated_at'
         
         sort_order = 'DESC' if sort_order.upper() == 'DESC' else 'ASC'
-        query += f" ORDER BY l.{sort_by} {sort_order}"
         
-        # Paginação
-        query += " LIMIT ? OFFSET ?"
-        params.extend([limit, offset])
+        page_query, count_query = _build_lead_search_sql(
+            term_sql, bool(status), assigned_mode, bool(city), bool(origin),
+            bool(date_from), bool(date_to), sort_by, sort_order, include_message_count
+        )
         
-        cursor.execute(query, params)
-        leads = [dict(row) for row in cursor.fetchall()]
-        
-        conn.close()
+        with self.db.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(page_query, params + [limit, offset])
+            leads = [dict(row) for row in cursor.fetchall()]
+            total = _pop_total(leads, cursor, count_query, params, offset)
         
         return {
             "leads": leads,
@@ -283,45 +565,69 @@ class LeadSearcher:
 
 class PerformanceCache:
     """
-    Cache simples em memória para queries frequentes
+    Cache LRU em memória para queries frequentes
     Em produção: usar Redis
+    
+    - OrderedDict mantém a ordem de uso: acima de max_size o item menos
+      usado recentemente é descartado
+    - Um heap de (expira_em, chave) permite remover expirados sem varrer
+      o cache inteiro
+    - Tempos em time.monotonic(), imune a ajustes de relógio
     """
-    def __init__(self, ttl_seconds: int = 300):
-        self.cache = {}
+    def __init__(self, ttl_seconds: int = 300, max_size: int = 10_000):
+        self.cache = OrderedDict()
         self.ttl = ttl_seconds
+        self.max_size = max_size
+        self._heap = []
     
     def get(self, key: str) -> Optional[Any]:
         """Busca item no cache"""
-        if key in self.cache:
-            item, timestamp = self.cache[key]
-            if (datetime.now() - timestamp).total_seconds() < self.ttl:
-                return item
-            else:
-                del self.cache[key]
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        
+        item, expires_at = entry
+        if monotonic() < expires_at:
+            self.cache.move_to_end(key)
+            return item
+        
+        del self.cache[key]
         return None
     
     def set(self, key: str, value: Any):
         """Adiciona item ao cache"""
-        self.cache[key] = (value, datetime.now())
+        expires_at = monotonic() + self.ttl
+        self.cache[key] = (value, expires_at)
+        self.cache.move_to_end(key)
+        heapq.heappush(self._heap, (expires_at, key))
+        
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+        
+        # Entradas órfãs (chave regravada ou descartada) acumulam no heap
+        if len(self._heap) > 2 * self.max_size:
+            self._heap = [(exp, k) for k, (_, exp) in self.cache.items()]
+            heapq.heapify(self._heap)
     
     def delete(self, key: str):
         """Remove item do cache"""
-        if key in self.cache:
-            del self.cache[key]
+        self.cache.pop(key, None)
     
     def clear(self):
         """Limpa todo o cache"""
         self.cache.clear()
+        self._heap.clear()
     
     def clear_expired(self):
         """Remove itens expirados"""
-        now = datetime.now()
-        expired_keys = [
-            key for key, (_, timestamp) in self.cache.items()
-            if (now - timestamp).total_seconds() >= self.ttl
-        ]
-        for key in expired_keys:
-            del self.cache[key]
+        now = monotonic()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self.cache.get(key)
+            # Só remove se a entrada do heap ainda corresponde ao item atual
+            if entry is not None and entry[1] == expires_at:
+                del self.cache[key]
 
 
 class QueryOptimizer:
@@ -331,7 +637,7 @@ class QueryOptimizer:
     def __init__(self):
         self.stats = {
             'total_queries': 0,
-            'slow_queries': [],
+            'slow_queries': deque(maxlen=100),  # Mantém apenas últimas 100 queries lentas
             'cache_hits': 0,
             'cache_misses': 0
         }
@@ -352,15 +658,12 @@ class QueryOptimizer:
                 'duration': duration,
                 'timestamp': datetime.now().isoformat()
             })
-            
-            # Mantém apenas últimas 100 queries lentas
-            if len(self.stats['slow_queries']) > 100:
-                self.stats['slow_queries'] = self.stats['slow_queries'][-100:]
     
     def get_stats(self) -> Dict[str, Any]:
         """Retorna estatísticas"""
         return {
             **self.stats,
+            'slow_queries': list(self.stats['slow_queries']),
             'cache_hit_rate': (
                 self.stats['cache_hits'] / self.stats['total_queries'] * 100
                 if self.stats['total_queries'] > 0 else 0
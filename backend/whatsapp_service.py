@@ -1,20 +1,127 @@
-import requests
+import asyncio
+import http.client
+import logging
+import queue
+import random
+import re
+import select
+import httpx
+import orjson
 from datetime import datetime
+from urllib.parse import urlsplit
+import threading
 import time
-from functools import wraps
+from functools import lru_cache, wraps
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_NON_DIGIT = re.compile(r"\D+")
+
+
+@lru_cache(maxsize=4096)
+def _normalize_phone(phone: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Normaliza o telefone (só dígitos) e valida o comprimento
+    
+    Sem efeitos colaterais, então o resultado é memorizado por string de
+    entrada: contatos recorrentes custam uma consulta ao cache.
+    
+    Returns:
+        (telefone normalizado, None) ou (None, motivo da rejeição)
+    """
+    # Remove caracteres não numéricos (em C, via regex; nada a fazer se já for só dígitos)
+    phone_clean = phone
+    if not phone_clean.isdigit():
+        phone_clean = _NON_DIGIT.sub("", phone_clean)
+    
+    # Valida comprimento mínimo
+    if len(phone_clean) < 10:
+        return None, "muito curto"
+    
+    # Valida comprimento máximo
+    if len(phone_clean) > 15:
+        return None, "muito longo"
+    
+    return phone_clean, None
+
 
 class WhatsAppService:
+    # Cache de leads por telefone usado no envio (evita um SELECT por mensagem)
+    LEAD_CACHE_TTL = 30  # segundos
+    LEAD_CACHE_MAX_SIZE = 4096
+
+    # Janela de agrupamento dos eventos "new_messages" enviados ao front-end
+    EMIT_BATCH_WINDOW = 0.005  # segundos
+
+    # Circuit breaker: com o VenomBot fora, envios falham na hora durante
+    # BREAKER_COOLDOWN em vez de esperar timeouts/retries a cada chamada
+    BREAKER_COOLDOWN = 30  # segundos
+
+    # Fila de mensagens recebidas (on_message) processadas em lotes
+    INBOUND_QUEUE_SIZE = 10000
+    INBOUND_BATCH_SIZE = 32
+
+    # Conexões keep-alive ociosas mantidas com o VenomBot
+    VENOM_POOL_SIZE = 16
+    # Ociosidade máxima (s) de uma conexão reaproveitada por um POST: bem
+    # abaixo do keepAliveTimeout do Node (5s), para não cair na corrida em
+    # que o VenomBot fecha a conexão enquanto o POST é enviado
+    VENOM_POST_MAX_IDLE = 2.0
+
+    # Conexão keep-alive encerrada pelo VenomBot: reabre e repete uma vez
+    # (um POST só se a requisição comprovadamente não chegou ao VenomBot)
+    _STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                                ConnectionResetError, BrokenPipeError)
+
     def __init__(self, database, socketio):
         self.db = database
         self.socketio = socketio
         self.venom_url = "http://localhost:3001"
         self.is_ready = False
         self.max_retries = 3
-        self.retry_delay = 2  # segundos
+        self.retry_delay = 2  # segundos (base do backoff exponencial)
+        self.max_retry_delay = 10  # segundos
         self.last_health_check = None
         self.health_check_interval = 30  # segundos
         self.connection_errors = 0
         self.max_connection_errors = 5
+        self._breaker_open_until = 0.0  # time.monotonic(); 0 = fechado
+
+        # Último resultado do /status do VenomBot (servido por get_status)
+        self._last_status = {"connected": False}
+        self._health_thread = None
+
+        # Conexões HTTP persistentes com o VenomBot (localhost): http.client
+        # direto, sem a pilha do requests. HTTPConnection não é thread-safe,
+        # então cada requisição pega uma conexão da pilha (LIFO) só para si;
+        # o lock protege apenas a pilha, não a requisição.
+        venom = urlsplit(self.venom_url)
+        self._venom_host = venom.hostname
+        self._venom_port = venom.port or 80
+        self._idle_conns = []  # [(conexão, time.monotonic() da devolução)]
+        self._conn_lock = threading.Lock()
+
+        # Cliente assíncrono (send_message_async): um só, no loop de fundo do
+        # serviço, seja qual for o loop de quem chama
+        self._aclient = None
+        self._aloop = None
+        self._aloop_lock = threading.Lock()
+
+        # Caches de leitura do envio: {telefone: (lead, expira_em)} e {id: usuário}
+        self._lead_cache = {}
+        self._users_by_id = None
+
+        # Eventos de nova mensagem aguardando o próximo flush: [(sala, evento)]
+        self._emit_queue = []
+        self._emit_lock = threading.Lock()
+        self._emit_timer = None
+
+        # Fila de mensagens recebidas e thread consumidora do próprio serviço:
+        # não depende do loop (possivelmente efêmero) de quem chama on_message
+        self._inbound_q = queue.Queue(maxsize=self.INBOUND_QUEUE_SIZE)
+        self._inbound_thread = threading.Thread(target=self._inbound_loop, daemon=True)
+        self._inbound_thread.start()
 
     # =============================
     # UTILITÁRIOS
@@ -24,61 +131,298 @@ class WhatsAppService:
         if not phone:
             return None
         
-        # Remove caracteres não numéricos
-        phone_clean = ''.join(filter(str.isdigit, str(phone)))
-        
-        # Valida comprimento mínimo
-        if len(phone_clean) < 10:
-            print(f"⚠️ Telefone inválido (muito curto): {phone}")
-            return None
-        
-        # Valida comprimento máximo
-        if len(phone_clean) > 15:
-            print(f"⚠️ Telefone inválido (muito longo): {phone}")
+        phone_clean, problem = _normalize_phone(str(phone))
+        if problem:
+            logger.warning("⚠️ Telefone inválido (%s): %s", problem, phone)
             return None
         
         return phone_clean
 
+    def _get_lead_by_phone_cached(self, phone):
+        """
+        get_lead_by_phone com cache de LEAD_CACHE_TTL segundos
+        
+        Só leads encontrados são guardados: um lead criado logo depois
+        aparece na próxima consulta.
+        """
+        now = time.monotonic()
+        entry = self._lead_cache.get(phone)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+
+        lead = self.db.get_lead_by_phone(phone)
+        if lead:
+            if len(self._lead_cache) >= self.LEAD_CACHE_MAX_SIZE:
+                # Descarta a entrada mais antiga (ordem de inserção)
+                self._lead_cache.pop(next(iter(self._lead_cache)), None)
+            self._lead_cache[phone] = (lead, now + self.LEAD_CACHE_TTL)
+        return lead
+
+    def refresh_users(self):
+        """Descarta o cache de usuários (chamar após criar/editar/remover usuário)"""
+        self._users_by_id = None
+
+    def _get_user(self, user_id):
+        """Busca usuário por id no cache {id: usuário}, montado sob demanda"""
+        users_by_id = self._users_by_id
+        if users_by_id is None:
+            users_by_id = {u["id"]: u for u in self.db.get_all_users()}
+            self._users_by_id = users_by_id
+        return users_by_id.get(user_id)
+
+    def queue_new_message(self, event, room=None):
+        """
+        Agenda um evento de nova mensagem para o front-end
+        
+        Eventos que chegam dentro de EMIT_BATCH_WINDOW são enviados juntos
+        como uma lista no evento "new_messages" (um emit por sala), em vez
+        de um frame WebSocket por mensagem. A primeira mensagem de uma
+        rajada atrasa no máximo EMIT_BATCH_WINDOW.
+        
+        Args:
+            event: Payload no mesmo formato do antigo evento "new_message"
+            room: Sala de destino (None = todos os clientes)
+        """
+        with self._emit_lock:
+            self._emit_queue.append((room, event))
+            if self._emit_timer is None:
+                self._emit_timer = threading.Timer(self.EMIT_BATCH_WINDOW, self._flush_new_messages)
+                self._emit_timer.daemon = True
+                self._emit_timer.start()
+
+    def _flush_new_messages(self):
+        """Envia os eventos acumulados, agrupados por sala"""
+        with self._emit_lock:
+            pending, self._emit_queue = self._emit_queue, []
+            self._emit_timer = None
+
+        by_room = {}
+        for room, event in pending:
+            by_room.setdefault(room, []).append(event)
+
+        for room, events in by_room.items():
+            try:
+                if room is None:
+                    self.socketio.emit("new_messages", events)
+                else:
+                    self.socketio.emit("new_messages", events, room=room)
+            except Exception as e:
+                logger.error("❌ Erro ao emitir lote de mensagens: %s", e)
+
+    def _backoff_delay(self, attempt, base=None):
+        """
+        Espera antes da próxima tentativa: exponencial com teto + jitter
+        
+        O jitter espalha as novas tentativas quando vários envios falham
+        juntos, em vez de todos baterem no VenomBot no mesmo instante.
+        """
+        base = self.retry_delay if base is None else base
+        return min(base * (2 ** attempt), self.max_retry_delay) + random.uniform(0, 0.5)
+
+    @staticmethod
+    def _conn_dropped(conn):
+        """
+        True se a conexão ociosa já foi fechada pelo VenomBot
+        
+        Um socket ocioso "legível" só pode ter EOF (ou lixo) pendente.
+        """
+        sock = conn.sock
+        if sock is None:
+            return True
+        try:
+            if hasattr(select, "poll"):
+                poller = select.poll()
+                poller.register(sock, select.POLLIN)
+                return bool(poller.poll(0))
+            return bool(select.select([sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return True
+
+    def _acquire_conn(self, max_idle=None):
+        """
+        Pega uma conexão ociosa viva da pilha ou abre uma nova
+        
+        Args:
+            max_idle: Se informado, conexões ociosas há mais tempo que isso
+                (segundos) são fechadas em vez de reaproveitadas
+        
+        Returns:
+            (conexão, reaproveitada)
+        """
+        now = time.monotonic()
+        with self._conn_lock:
+            while self._idle_conns:
+                conn, released_at = self._idle_conns.pop()
+                if (max_idle is None or now - released_at <= max_idle) and not self._conn_dropped(conn):
+                    return conn, True
+                conn.close()
+        return http.client.HTTPConnection(self._venom_host, self._venom_port), False
+
+    def _release_conn(self, conn):
+        """Devolve a conexão à pilha (ou fecha, se a pilha estiver cheia)"""
+        with self._conn_lock:
+            if len(self._idle_conns) < self.VENOM_POOL_SIZE:
+                self._idle_conns.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def _venom_request(self, method, path, body=None, timeout=10):
+        """
+        Requisição ao VenomBot por uma conexão persistente do pool
+        
+        Se uma conexão reaproveitada tiver sido fechada pelo VenomBot, a
+        requisição é repetida uma vez numa conexão nova: sempre para GET/HEAD;
+        para POST só se ela não chegou ao VenomBot (falha ao escrever, ou
+        conexão fechada antes de qualquer byte de resposta). Um POST também
+        não reaproveita conexões ociosas há mais de VENOM_POST_MAX_IDLE.
+        
+        Returns:
+            (status HTTP, corpo em bytes)
+        
+        Raises:
+            OSError / http.client.HTTPException se o VenomBot não responder
+        """
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        idempotent = method in ("GET", "HEAD")
+        for attempt in range(2):
+            conn, reused = self._acquire_conn(None if idempotent else self.VENOM_POST_MAX_IDLE)
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            sent = False
+            response = None
+            try:
+                conn.request(method, path, body, headers)
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+            except self._STALE_CONNECTION_ERRORS as e:
+                conn.close()
+                not_delivered = not sent or (
+                    response is None
+                    and isinstance(e, (http.client.RemoteDisconnected, ConnectionResetError))
+                )
+                if attempt or not reused or not (idempotent or not_delivered):
+                    raise
+                continue
+            except BaseException:
+                conn.close()
+                raise
+            
+            if response.will_close:
+                conn.close()
+            else:
+                self._release_conn(conn)
+            return response.status, data
+
+    def _trip_breaker(self):
+        """Abre o circuit breaker por BREAKER_COOLDOWN segundos"""
+        self._breaker_open_until = time.monotonic() + self.BREAKER_COOLDOWN
+        logger.warning("🚧 VenomBot indisponível: envios suspensos por %ss", self.BREAKER_COOLDOWN)
+
+    def _register_send_failure(self):
+        """
+        Envio sem resposta do VenomBot: marca desconectado e conta o erro
+        
+        O breaker só abre após max_connection_errors erros consecutivos;
+        retorna True quando isso acontece.
+        """
+        self.is_ready = False
+        self.connection_errors += 1
+        if self.connection_errors >= self.max_connection_errors:
+            self._trip_breaker()
+            return True
+        return False
+
+    def _breaker_open(self):
+        """True enquanto o circuit breaker estiver aberto (falha rápida)"""
+        if time.monotonic() < self._breaker_open_until:
+            logger.error("❌ VenomBot indisponível (circuit breaker aberto). Mensagem não enviada.")
+            return True
+        return False
+
     # =============================
     # STATUS DE CONEXÃO E HEALTH CHECK
     # =============================
     def check_connection(self):
         """Verifica se VenomBot está conectado - COM RETRY"""
         max_attempts = 2
-        delay = 1
+        base_delay = 1
         
         for attempt in range(max_attempts):
             try:
-                response = requests.get(f"{self.venom_url}/status", timeout=5)
-                if response.status_code == 200:
-                    data = response.json()
+                status, body = self._venom_request("GET", "/status", timeout=5)
+                if status == 200:
+                    data = orjson.loads(body)
                     self.is_ready = data.get("connected", False)
                     self.last_health_check = datetime.now()
                     self.connection_errors = 0
+                    self._breaker_open_until = 0.0
+                    self._last_status = data
                     
                     if self.is_ready:
-                        print(f"✅ WhatsApp conectado: {data.get('phone', 'N/A')}")
+                        logger.info("✅ WhatsApp conectado: %s", data.get("phone", "N/A"))
                     else:
-                        print(f"⚠️ WhatsApp não conectado")
+                        logger.warning("⚠️ WhatsApp não conectado")
                     
                     return data
+                self.last_health_check = datetime.now()
+                self._last_status = {"connected": False}
                 return {"connected": False}
                 
-            except requests.exceptions.RequestException as e:
+            except (OSError, http.client.HTTPException, orjson.JSONDecodeError) as e:
                 if attempt < max_attempts - 1:
-                    print(f"⚠️ Tentativa {attempt + 1}/{max_attempts} falhou. Tentando novamente em {delay}s...")
+                    delay = self._backoff_delay(attempt, base_delay)
+                    logger.warning("⚠️ Tentativa %d/%d falhou. Tentando novamente em %.1fs...", attempt + 1, max_attempts, delay)
                     time.sleep(delay)
                 else:
-                    print(f"❌ Erro ao verificar conexão com VenomBot: {e}")
+                    logger.error("❌ Erro ao verificar conexão com VenomBot: %s", e)
                     self.is_ready = False
                     self.last_health_check = datetime.now()
                     self.connection_errors += 1
                     
                     if self.connection_errors >= self.max_connection_errors:
-                        print(f"🚨 ALERTA: {self.connection_errors} erros consecutivos de conexão!")
+                        logger.critical("🚨 ALERTA: %d erros consecutivos de conexão!", self.connection_errors)
+                        self._trip_breaker()
                     
+                    self._last_status = {"connected": False}
                     return {"connected": False}
     
+    def start_health_monitor(self):
+        """
+        Inicia a thread que verifica o VenomBot a cada health_check_interval
+        
+        Mantém o status em cache atualizado para get_status, sem uma
+        chamada de rede por requisição ao /api/whatsapp/status.
+        """
+        if self._health_thread is not None:
+            return
+        
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._health_thread.start()
+        logger.info("💓 Monitoramento do WhatsApp iniciado (intervalo: %ss)", self.health_check_interval)
+
+    def _health_loop(self):
+        """
+        Loop do health check em segundo plano
+        
+        Dorme só até a próxima verificação vencer, contando da última (feita
+        aqui ou por ensure_connected): com um intervalo fixo, uma verificação
+        no meio do sono fazia o loop pular a rodada e o status em cache
+        chegava a quase 2x health_check_interval de idade.
+        """
+        while True:
+            try:
+                if self.should_check_health():
+                    self.check_connection()
+            except Exception as e:
+                logger.error("❌ Erro no health check do WhatsApp: %s", e)
+            
+            elapsed = 0
+            if self.last_health_check is not None:
+                elapsed = (datetime.now() - self.last_health_check).total_seconds()
+            time.sleep(min(max(self.health_check_interval - elapsed, 1), self.health_check_interval))
+
     def should_check_health(self):
         """Verifica se deve fazer health check"""
         if self.last_health_check is None:
@@ -88,11 +432,10 @@ class WhatsAppService:
     
     def ensure_connected(self):
         """Garante que está conectado antes de operações críticas"""
-        if self.should_check_health():
-            self.check_connection()
-        
-        if not self.is_ready:
-            print("⚠️ WhatsApp não está conectado. Tentando reconectar...")
+        # Uma única verificação: vencida pelo intervalo ou desconectado
+        if self.should_check_health() or not self.is_ready:
+            if not self.is_ready:
+                logger.warning("⚠️ WhatsApp não está conectado. Tentando reconectar...")
             self.check_connection()
         
         return self.is_ready
@@ -104,6 +447,10 @@ class WhatsAppService:
         """
         Callback chamado pelo VenomBot (via webhook)
         Quando um lead envia mensagem para o número da empresa
+        
+        Só valida e enfileira: banco e evento para o front-end ficam com a
+        thread _inbound_loop. Com a fila cheia, o await segura o chamador
+        (back-pressure) em vez de acumular memória.
         """
         try:
             phone = message.get("from", "").replace("@c.us", "").replace("+", "").strip()
@@ -117,152 +464,331 @@ class WhatsAppService:
             # Valida telefone
             phone = self.validate_phone(phone)
             if not phone:
-                print(f"❌ Telefone inválido rejeitado")
+                logger.warning("❌ Telefone inválido rejeitado")
                 return
 
             # Valida conteúdo
             if not content or len(content) > 4096:
-                print(f"⚠️ Mensagem inválida (vazia ou muito grande)")
+                logger.warning("⚠️ Mensagem inválida (vazia ou muito grande)")
                 return
 
-            print(f"📨 Mensagem recebida de {sender_name} ({phone}): {content[:50]}...")
+            # Prévia única (log da timeline); o logger lê só os 50 primeiros caracteres
+            preview = content[:100]
+            logger.info("📨 Mensagem recebida de %s (%s): %.50s...", sender_name, phone, preview)
 
-            # Cria ou busca o lead no banco
-            lead = self.db.create_or_get_lead(phone, sender_name)
+            # "now": um único instante para mensagem, log e evento
+            item = {
+                "phone": phone,
+                "sender_name": sender_name,
+                "content": content,
+                "preview": preview,
+                "now": datetime.now()
+            }
+            try:
+                self._inbound_q.put_nowait(item)
+            except queue.Full:
+                # Espera vaga na fila sem travar o loop do chamador
+                await asyncio.to_thread(self._inbound_q.put, item)
 
-            # Salva a mensagem recebida
-            self.db.add_message(
-                lead_id=lead["id"],
-                sender_type="lead",
-                sender_name=sender_name,
-                content=content
-            )
+        except Exception as e:
+            # Traceback completo só com DEBUG ativo
+            logger.error("❌ Erro ao processar mensagem recebida: %s", e,
+                         exc_info=logger.isEnabledFor(logging.DEBUG))
 
-            # Adiciona log na timeline do lead
-            self.db.add_lead_log(
-                lead_id=lead["id"],
-                action="mensagem_recebida",
-                user_name=sender_name,
-                details=content[:100]
-            )
+    def _inbound_loop(self):
+        """
+        Consumidor da fila de entrada (thread do serviço)
+        
+        Pega até INBOUND_BATCH_SIZE mensagens por vez, grava todas com um
+        commit (add_messages_bulk) e agenda os eventos "new_messages".
+        """
+        while True:
+            batch = [self._inbound_q.get()]
+            while len(batch) < self.INBOUND_BATCH_SIZE:
+                try:
+                    batch.append(self._inbound_q.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._process_inbound_batch(batch)
+            except Exception as e:
+                logger.error("❌ Erro ao processar lote de %d mensagens recebidas: %s", len(batch), e,
+                             exc_info=logger.isEnabledFor(logging.DEBUG))
+            finally:
+                for _ in batch:
+                    self._inbound_q.task_done()
 
-            # Emite atualização em tempo real pro front-end
-            self.socketio.emit("new_message", {
+    def _process_inbound_batch(self, batch):
+        """
+        Cria/busca os leads, grava o lote e emite os eventos
+        
+        Uma mensagem com problema (lead não criado, erro no banco) é
+        descartada sozinha, com log; as demais do lote seguem.
+        """
+        leads = {}
+        entries = []
+        for item in batch:
+            phone = item["phone"]
+            try:
+                if phone not in leads:
+                    leads[phone] = self.db.create_or_get_lead(phone, item["sender_name"])
+            except Exception as e:
+                leads[phone] = None
+                logger.error("❌ Erro ao criar/buscar lead %s: %s", phone, e)
+            lead = leads[phone]
+            if not lead:
+                logger.error("❌ Mensagem de %s descartada: lead não encontrado/criado", phone)
+                continue
+            entries.append((item, {
                 "lead_id": lead["id"],
-                "phone": phone,
-                "name": sender_name,
-                "content": content,
-                "timestamp": datetime.now().isoformat(),
+                "sender_type": "lead",
+                "sender_name": item["sender_name"],
+                "content": item["content"],
+                "action": "mensagem_recebida",
+                "details": item["preview"],
+                "created_at": item["now"]
+            }))
+
+        # Salva as mensagens recebidas + logs na timeline (um commit para o lote)
+        try:
+            self.db.add_messages_bulk([entry for _, entry in entries])
+            saved = entries
+        except Exception as e:
+            # Lote recusado: grava uma a uma para isolar a mensagem com problema
+            logger.error("❌ Erro ao gravar lote de mensagens, gravando individualmente: %s", e)
+            saved = []
+            for item, entry in entries:
+                try:
+                    self.db.record_message_and_log(**entry)
+                    saved.append((item, entry))
+                except Exception as e:
+                    logger.error("❌ Mensagem de %s descartada: %s", item["phone"], e)
+
+        # Emite atualização em tempo real pro front-end
+        for item, entry in saved:
+            self.queue_new_message({
+                "lead_id": entry["lead_id"],
+                "phone": item["phone"],
+                "name": item["sender_name"],
+                "content": item["content"],
+                "timestamp": item["now"].isoformat(),
                 "sender_type": "lead"
             })
 
-            print("✅ Mensagem recebida e registrada com sucesso")
-
-        except Exception as e:
-            print(f"❌ Erro ao processar mensagem recebida: {e}")
-            import traceback
-            traceback.print_exc()
+        logger.info("✅ %d mensagem(ns) recebida(s) e registrada(s) com sucesso", len(saved))
 
     # =============================
     # ENVIAR MENSAGEM (LEAD OU GESTOR)
     # =============================
-    def send_message(self, phone, content, vendedor_id=None, bypass_lead_check=False):
-        """Envia mensagem via VenomBot com retry (aceita bypass para gestores)"""
-        
-        # Validações
+    def _validate_outgoing(self, phone, content):
+        """Valida telefone e conteúdo de uma mensagem de saída; retorna o telefone normalizado"""
         phone = self.validate_phone(phone)
         if not phone:
-            print(f"❌ Telefone inválido: {phone}")
-            return False
+            logger.warning("❌ Telefone inválido: %s", phone)
+            return None
         
         if not content or not content.strip():
-            print(f"❌ Mensagem vazia não pode ser enviada")
-            return False
+            logger.warning("❌ Mensagem vazia não pode ser enviada")
+            return None
         
         if len(content) > 4096:
-            print(f"❌ Mensagem muito grande (max 4096 caracteres)")
+            logger.warning("❌ Mensagem muito grande (max 4096 caracteres)")
+            return None
+        
+        return phone
+
+    def _record_sent(self, phone, content, vendedor_id, bypass_lead_check):
+        """
+        Registra a mensagem enviada e avisa o front-end (após o VenomBot aceitar)
+        
+        Retorna o id da mensagem gravada, True quando não há lead para
+        registrar (bypass para gestores) ou False se o envio for recusado.
+        """
+        lead = self._get_lead_by_phone_cached(phone)
+
+        # ⚠️ NOVO: permite envio para gestores sem lead
+        if not lead and not bypass_lead_check:
+            logger.warning("⚠️ Nenhum lead encontrado com o número %s. Mensagem não será enviada.", phone)
             return False
+
+        vendedor_name = "Vendedor"
+        if vendedor_id:
+            user = self._get_user(vendedor_id)
+            if user:
+                vendedor_name = user["name"]
+
+        # Um único instante para mensagem, log e evento
+        now = datetime.now()
+
+        # Só salva se for lead real
+        message_id = None
+        if lead:
+            message_id = self.db.record_message_and_log(
+                lead_id=lead["id"],
+                sender_type="vendedor",
+                sender_name=vendedor_name,
+                content=content,
+                action="mensagem_enviada",
+                details=content[:100],
+                created_at=now
+            )
+
+        # Emite evento de envio para o front-end
+        self.socketio.emit("message_sent", {
+            "lead_id": lead["id"] if lead else None,
+            "phone": phone,
+            "content": content,
+            "timestamp": now.isoformat(),
+            "sender_type": "vendedor",
+            "sender_id": vendedor_id
+        })
+
+        logger.info("✅ Mensagem enviada com sucesso (lead ou gestor)")
+        return message_id or True
+
+    def _prepare_send(self, phone, content):
+        """Validações comuns aos envios; retorna o telefone normalizado ou None"""
+        phone = self._validate_outgoing(phone, content)
+        if not phone:
+            return None
+        
+        # Sem health check prévio: o próprio POST detecta o VenomBot fora
+        if self._breaker_open():
+            return None
+        
+        return phone
+
+    def _send_retry_delay(self, attempt, status=None, body=None, error=None):
+        """
+        Política de retry do envio (compartilhada por send_message e send_message_async)
+        
+        Chamado após uma tentativa sem sucesso: resposta HTTP != 200
+        (status/body) ou exceção (error). Registra a falha e retorna quantos
+        segundos esperar antes da próxima tentativa, ou None para desistir.
+        """
+        last_attempt = attempt >= self.max_retries - 1
+        
+        if error is None:
+            logger.error("❌ Erro HTTP %s: %s", status, body.decode("utf-8", "replace"))
+            return None if last_attempt else self._backoff_delay(attempt)
+        
+        if isinstance(error, (ConnectionRefusedError, httpx.ConnectError, httpx.ConnectTimeout)):
+            # A requisição não chegou ao VenomBot: seguro tentar de novo
+            logger.warning("⚠️ Falha ao conectar ao VenomBot: %s", error)
+            if self._register_send_failure() or last_attempt:
+                return None
+            return self._backoff_delay(attempt)
         
-        # Verifica conexão
-        if not self.ensure_connected():
-            print(f"❌ WhatsApp não conectado. Não é possível enviar mensagem.")
+        if isinstance(error, (OSError, http.client.HTTPException, httpx.TransportError)):
+            # Pode já ter chegado ao VenomBot: não reenvia (evita mensagem duplicada)
+            logger.error("❌ VenomBot não respondeu ao envio: %s", error)
+            self._register_send_failure()
+            return None
+        
+        logger.error("❌ Erro inesperado ao enviar mensagem: %s", error,
+                     exc_info=error if logger.isEnabledFor(logging.DEBUG) else False)
+        return None
+
+    def send_message(self, phone, content, vendedor_id=None, bypass_lead_check=False):
+        """
+        Envia mensagem via VenomBot com retry (aceita bypass para gestores)
+        
+        Retorna o id da mensagem gravada (ou True, sem lead) em caso de
+        sucesso e False em caso de falha.
+        """
+        phone = self._prepare_send(phone, content)
+        if not phone:
             return False
         
-        # Tenta enviar com retry
+        payload = orjson.dumps({"phone": phone, "message": content})
         for attempt in range(self.max_retries):
+            logger.info("📤 Enviando mensagem para %s (tentativa %d/%d)", phone, attempt + 1, self.max_retries)
             try:
-                print(f"📤 Enviando mensagem para {phone} (tentativa {attempt + 1}/{self.max_retries})")
-                
-                response = requests.post(
-                    f"{self.venom_url}/send",
-                    json={"phone": phone, "message": content},
-                    timeout=10
-                )
+                status, body = self._venom_request("POST", "/send", payload, timeout=10)
+                if status == 200:
+                    self.connection_errors = 0
+                    return self._record_sent(phone, content, vendedor_id, bypass_lead_check)
+                delay = self._send_retry_delay(attempt, status=status, body=body)
+            except Exception as e:
+                delay = self._send_retry_delay(attempt, error=e)
+            
+            if delay is None:
+                return False
+            time.sleep(delay)
+        
+        return False
+
+    def _get_aloop(self):
+        """
+        Loop de fundo do serviço (thread daemon, criado sob demanda)
+        
+        Um AsyncClient só funciona no loop em que foi criado; quem chama
+        send_message_async pode estar num loop efêmero (asyncio.run por
+        requisição), então o cliente vive aqui e nunca fica órfão.
+        """
+        with self._aloop_lock:
+            if self._aloop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True).start()
+                self._aloop = loop
+        return self._aloop
 
-                if response.status_code != 200:
-                    print(f"❌ Erro HTTP {response.status_code}: {response.text}")
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
-                        continue
-                    return False
-
-                lead = self.db.get_lead_by_phone(phone)
-
-                # ⚠️ NOVO: permite envio para gestores sem lead
-                if not lead and not bypass_lead_check:
-                    print(f"⚠️ Nenhum lead encontrado com o número {phone}. Mensagem não será enviada.")
-                    return False
-
-                vendedor_name = "Vendedor"
-                if vendedor_id:
-                    users = self.db.get_all_users()
-                    user = next((u for u in users if u["id"] == vendedor_id), None)
-                    if user:
-                        vendedor_name = user["name"]
-
-                # Só salva se for lead real
-                if lead:
-                    self.db.add_message(
-                        lead_id=lead["id"],
-                        sender_type="vendedor",
-                        sender_name=vendedor_name,
-                        content=content
-                    )
-
-                    self.db.add_lead_log(
-                        lead_id=lead["id"],
-                        action="mensagem_enviada",
-                        user_name=vendedor_name,
-                        details=content[:100]
-                    )
-
-                # Emite evento de envio para o front-end
-                self.socketio.emit("message_sent", {
-                    "lead_id": lead["id"] if lead else None,
-                    "phone": phone,
-                    "content": content,
-                    "timestamp": datetime.now().isoformat(),
-                    "sender_type": "vendedor",
-                    "sender_id": vendedor_id
-                })
-
-                print("✅ Mensagem enviada com sucesso (lead ou gestor)")
-                return True
+    async def _apost(self, path, payload):
+        """POST pelo cliente httpx compartilhado (roda no loop de fundo)"""
+        if self._aclient is None:
+            self._aclient = httpx.AsyncClient(
+                base_url=self.venom_url,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=httpx.Timeout(10.0),
+                headers={"Content-Type": "application/json"}
+            )
+        return await self._aclient.post(path, content=payload)
 
+    async def send_message_async(self, phone, content, vendedor_id=None, bypass_lead_check=False):
+        """
+        Versão assíncrona de send_message
+        
+        Mesma validação e política de retry do caminho síncrono; a espera
+        entre tentativas não prende uma thread, o POST usa o cliente httpx
+        do loop de fundo e a gravação no banco roda fora do loop.
+        """
+        phone = self._prepare_send(phone, content)
+        if not phone:
+            return False
+        
+        payload = orjson.dumps({"phone": phone, "message": content})
+        for attempt in range(self.max_retries):
+            logger.info("📤 Enviando mensagem para %s (tentativa %d/%d)", phone, attempt + 1, self.max_retries)
+            try:
+                response = await asyncio.wrap_future(
+                    asyncio.run_coroutine_threadsafe(self._apost("/send", payload), self._get_aloop())
+                )
+                if response.status_code == 200:
+                    self.connection_errors = 0
+                    return await asyncio.to_thread(self._record_sent, phone, content, vendedor_id, bypass_lead_check)
+                delay = self._send_retry_delay(attempt, status=response.status_code, body=response.content)
             except Exception as e:
-                print(f"❌ Erro inesperado ao enviar mensagem: {e}")
-                import traceback
-                traceback.print_exc()
+                delay = self._send_retry_delay(attempt, error=e)
+            
+            if delay is None:
                 return False
+            await asyncio.sleep(delay)
         
         return False
 
     # =============================
     # STATUS E DESCONECTAR
     # =============================
-    def get_status(self):
-        """Retorna status atual do VenomBot com informações detalhadas"""
-        status = self.check_connection()
+    def get_status(self, force=False):
+        """
+        Retorna status atual do VenomBot com informações detalhadas
+        
+        Usa o resultado da última verificação (mantido pela thread de
+        health check); `force=True` consulta o VenomBot na hora.
+        """
+        if force or self.last_health_check is None:
+            self.check_connection()
+        status = self._last_status
         
         return {
             "connected": status.get("connected", False),
@@ -277,12 +803,12 @@ class WhatsAppService:
     def disconnect(self):
         """Força desconexão manual do VenomBot"""
         try:
-            response = requests.post(f"{self.venom_url}/disconnect", timeout=5)
-            if response.status_code == 200:
-                print("🔌 Desconectado do WhatsApp com sucesso")
+            status, body = self._venom_request("POST", "/disconnect", timeout=5)
+            if status == 200:
+                logger.info("🔌 Desconectado do WhatsApp com sucesso")
                 self.is_ready = False
                 return {"success": True}
-            return {"success": False, "error": response.text}
+            return {"success": False, "error": body.decode("utf-8", "replace")}
         except Exception as e:
-            print(f"❌ Erro ao desconectar: {e}")
+            logger.error("❌ Erro ao desconectar: %s", e)
             return {"success": False, "error": str(e)}
@@ -38,21 +38,30 @@ export default function Dashboard({ user, onLogout }) {
       }
     });
 
-    // 📩 Nova mensagem
-    newSocket.on('new_message', (data) => {
-      if (selectedLead && data.lead_id === selectedLead.id) {
-        setMessages((prev) => [...prev, {
+    // 📩 Novas mensagens (o backend agrupa rajadas em um único evento com uma lista)
+    const handleNewMessages = (payload) => {
+      const batch = Array.isArray(payload) ? payload : [payload];
+      const current = batch.filter((data) => selectedLead && data.lead_id === selectedLead.id);
+      const others = batch.filter((data) => !(selectedLead && data.lead_id === selectedLead.id));
+
+      if (current.length) {
+        setMessages((prev) => [...prev, ...current.map((data) => ({
           content: data.content,
           sender_type: data.sender_type,
           timestamp: data.timestamp,
-        }]);
-      } else {
-        setNewMessagesCount((c) => c + 1);
+        }))]);
+      }
+      if (others.length) {
+        setNewMessagesCount((c) => c + others.length);
         playSound(newMessageSound);
-        toast.info(`💬 Nova mensagem de ${data.lead_name || 'Lead desconhecido'}`);
+        others.forEach((data) => {
+          toast.info(`💬 Nova mensagem de ${data.lead_name || data.name || 'Lead desconhecido'}`);
+        });
       }
       refreshLeads();
-    });
+    };
+    newSocket.on('new_messages', handleNewMessages);
+    newSocket.on('new_message', handleNewMessages);
 
     // 👤 Novo lead
     newSocket.on('lead_assigned', (data) => {
@@ -1,5 +1,6 @@
 import os
 import platform
+import socket
 import subprocess
 import time
 
@@ -8,6 +9,25 @@ print("🚀 Iniciando CRM WhatsApp Veloce...")
 BASE_PATH = os.path.expanduser("~/Desktop/crm-whatsapp")
 SYSTEM = platform.system().lower()
 
+
+def wait_ready(port, host="localhost", timeout=15):
+    """
+    Aguarda o serviço aceitar conexões TCP em host:port ou o timeout
+
+    Só a porta aberta basta: endpoints como /health do backend dependem do
+    VenomBot, que ainda não subiu nesse ponto.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((host, port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    print(f"⚠️ {host}:{port} não respondeu em {timeout}s, seguindo mesmo assim...")
+    return False
+
+
 # ========= BACKEND =========
 print("🔹 Iniciando Backend (Flask)...")
 backend_path = os.path.join(BASE_PATH, "backend")
@@ -19,13 +39,13 @@ else:
     activate_cmd = f"cd {backend_path} && source venv/bin/activate && python3 app.py"
 
 subprocess.Popen(activate_cmd, shell=True)
-time.sleep(3)
+wait_ready(5000)
 
 # ========= WHATSAPP SERVICE =========
 print("🔹 Iniciando WhatsApp Service (Node)...")
 whatsapp_path = os.path.join(BASE_PATH, "whatsapp-service")
 subprocess.Popen(f"cd {whatsapp_path} && npm start", shell=True)
-time.sleep(3)
+wait_ready(3001)
 
 # ========= FRONTEND =========
 print("🔹 Iniciando Frontend (React/Vite)...")